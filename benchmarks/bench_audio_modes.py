@@ -0,0 +1,97 @@
+"""
+CPU and wall time per minute of audio for the audio download modes.
+
+MP3 modes re-encode the stream for the 128/320 kbps buttons; m4a and opus
+only remux YouTube's own stream into a new container (`-acodec copy`).
+The ffmpeg arguments come from workers/postprocess.py, so this measures
+exactly what the post-processing pool runs. Only that step is measured;
+the download is the same for every mode.
+
+Without arguments, one-minute AAC and Opus sources are synthesised with
+ffmpeg; pass downloaded streams to measure real ones instead:
+
+    python benchmarks/bench_audio_modes.py [source.m4a source.webm] [rounds]
+"""
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("ADMIN_IDS", "0")
+os.environ.setdefault("DOWNLOAD_DIR", "/tmp/bench-downloads/")
+
+from workers.postprocess import audio_args  # noqa: E402
+
+ROUNDS = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+# mode -> (source, output extension, codec arguments)
+MODES = {
+    'mp3 128kbps': ('aac', 'mp3', audio_args('mp4a', 'mp3', '128k')),
+    'mp3 320kbps': ('aac', 'mp3', audio_args('mp4a', 'mp3', '320k')),
+    'm4a remux': ('aac', 'm4a', audio_args('mp4a', 'm4a')),
+    'opus remux': ('opus', 'opus', audio_args('opus', 'opus')),
+}
+
+
+def ffmpeg(*args: str) -> None:
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', *args], check=True)
+
+
+def duration(path: str) -> float:
+    output = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+        check=True, capture_output=True, text=True).stdout
+    return float(output.strip())
+
+
+def make_sources(workdir: str) -> dict:
+    if len(sys.argv) > 2:
+        return {'aac': sys.argv[1], 'opus': sys.argv[2]}
+    # Noise rather than a sine wave, so the encoder has real work to do
+    signal = ['-f', 'lavfi', '-i', 'anoisesrc=d=60:c=pink:r=48000', '-ac', '2']
+    aac = os.path.join(workdir, 'source.m4a')
+    opus = os.path.join(workdir, 'source.webm')
+    ffmpeg(*signal, '-c:a', 'aac', '-b:a', '128k', aac)
+    ffmpeg(*signal, '-c:a', 'libopus', '-b:a', '128k', opus)
+    return {'aac': aac, 'opus': opus}
+
+
+def measure(source: str, output: str, codec_args: list) -> tuple:
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    ffmpeg('-i', source, '-vn', *codec_args, output)
+    wall = time.perf_counter() - started
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return cpu, wall
+
+
+def main() -> None:
+    if shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None:
+        sys.exit("ffmpeg and ffprobe are required")
+    workdir = tempfile.mkdtemp(prefix='bench-audio-')
+    try:
+        sources = make_sources(workdir)
+        print(f"{'mode':<14}{'CPU s/min':>12}{'wall s/min':>12}{'output MB/min':>15}")
+        for mode, (source_kind, extension, codec_args) in MODES.items():
+            source = sources[source_kind]
+            minutes = duration(source) / 60
+            output = os.path.join(workdir, f'out.{extension}')
+            cpu = wall = 0.0
+            for _ in range(ROUNDS):
+                round_cpu, round_wall = measure(source, output, codec_args)
+                cpu += round_cpu
+                wall += round_wall
+            size = os.path.getsize(output) / (1024 * 1024)
+            print(f"{mode:<14}{cpu / ROUNDS / minutes:>12.3f}{wall / ROUNDS / minutes:>12.3f}"
+                  f"{size / minutes:>15.2f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
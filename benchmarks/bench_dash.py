@@ -0,0 +1,91 @@
+"""
+Video downloads with parallel DASH streams: success rate and wall time.
+
+For every resolution get_video_details offers for the given videos, this
+downloads the video-only stream alone, the audio stream alone, and then
+both side by side followed by the stream-copy merge, the way
+download_video fetches videos. It reports, per resolution, how many
+downloads succeeded and the parallel time against the larger stream
+alone. Needs network access and ffmpeg; files go to a throwaway store.
+
+    python benchmarks/bench_dash.py URL [URL ...]
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+WORKDIR = tempfile.mkdtemp(prefix="bench-dash-")
+os.environ.setdefault("ADMIN_IDS", "0")
+os.environ["DOWNLOAD_DIR"] = WORKDIR + "/"
+os.environ["BOT_DB_PATH"] = os.path.join(WORKDIR, "bot.db")
+
+
+def clear_store(store_dir: str) -> None:
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.makedirs(store_dir)
+
+
+async def run(urls: list) -> None:
+    from config import STORE_DIR
+    from workers.extractor import start_extractor_pool, shutdown_extractor_pool
+    from workers.ydl_pool import dash_profiles
+    from workers.yt_dl import get_video_details, _extract_raw_info, _download_stream, _download_video
+
+    loop = asyncio.get_running_loop()
+    results = defaultdict(lambda: {'offered': 0, 'ok': 0, 'dash': 0, 'ratios': []})
+    start_extractor_pool()
+    try:
+        for url in urls:
+            details = await get_video_details(url)
+            info = await loop.run_in_executor(None, _extract_raw_info, url)
+            for fmt in details['formats']:
+                resolution = fmt['resolution']
+                if not resolution.endswith('p'):
+                    continue
+                row = results[resolution]
+                row['offered'] += 1
+                video_profile, audio_profile = dash_profiles(resolution)
+                try:
+                    timings = []
+                    for profile in (video_profile, audio_profile):
+                        clear_store(STORE_DIR)
+                        started = time.perf_counter()
+                        await loop.run_in_executor(None, _download_stream, profile, info, None)
+                        timings.append(time.perf_counter() - started)
+                    clear_store(STORE_DIR)
+                    started = time.perf_counter()
+                    mode = await _download_video(url, resolution, os.path.join(STORE_DIR, 'out.mp4'), None)
+                    parallel = time.perf_counter() - started
+                except Exception as e:
+                    print(f"{details['video_id']} {resolution}: failed ({e})")
+                    continue
+                row['ok'] += 1
+                row['dash'] += mode == 'dash'
+                row['ratios'].append(parallel / max(timings))
+                print(f"{details['video_id']} {resolution}: video {timings[0]:.1f}s, audio {timings[1]:.1f}s, "
+                      f"{mode} {parallel:.1f}s")
+    finally:
+        shutdown_extractor_pool()
+
+    print(f"\n{'resolution':<12}{'offered':>8}{'ok':>6}{'dash':>6}{'parallel / larger stream':>26}")
+    for resolution, row in sorted(results.items(), key=lambda item: int(item[0][:-1])):
+        ratio = sum(row['ratios']) / len(row['ratios']) if row['ratios'] else float('nan')
+        print(f"{resolution:<12}{row['offered']:>8}{row['ok']:>6}{row['dash']:>6}{ratio:>26.2f}")
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    try:
+        asyncio.run(run(sys.argv[1:]))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+"""
+Offline microbenchmarks of the bot's hot paths, written as JSON.
+
+Everything runs locally: yt_dlp is replaced by a stand-in whose extractor
+replays the info dicts recorded in fixtures/info_dicts.json, the database
+is a throwaway SQLite file and the Bot answers every API method itself.
+Measured are BotDB operations, get_video_details and its format table,
+URL classification, translator lookups, keyboard building and the time
+handle_links takes to dispatch an update through the real Dispatcher.
+
+    python benchmarks/bench_hot_paths.py [--output results.json] [--compare baseline.json]
+                                         [--only NAME ...] [--scale 1.0]
+
+Every result carries the mean, median and p99 seconds per operation over
+a number of rounds, plus operations per second. With --compare, the
+medians are set against an earlier results file, e.g. one written on
+another commit.
+"""
+import argparse
+import asyncio
+import copy
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+# Throwaway directory of a run, set by prepare_environment()
+WORKDIR = ""
+
+FIXTURES = os.path.join(BENCH_DIR, "fixtures", "info_dicts.json")
+USER_ID = 1000
+URLS = [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtu.be/9bZkp7q19f0?si=abcdef",
+    "https://www.youtube.com/shorts/jNQXAC9IVRw",
+    "https://m.youtube.com/watch?v=dQw4w9WgXcQ&list=PL590L5WQmH8fJ54F369BLDSqIwcs-TCfs&index=2",
+    "https://www.youtube.com/playlist?list=PL590L5WQmH8fJ54F369BLDSqIwcs-TCfs",
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=WL",
+    "https://vimeo.com/76979871",
+    "not a link at all",
+]
+
+
+def prepare_environment() -> None:
+    """Point the bot's config at a throwaway directory; must run before config is imported."""
+    global WORKDIR
+    WORKDIR = tempfile.mkdtemp(prefix="bench-hot-")
+    os.environ.setdefault("ADMIN_IDS", "0")
+    os.environ.setdefault("API_TOKEN", "123456:bench")
+    os.environ["DOWNLOAD_DIR"] = WORKDIR + "/"
+    os.environ["BOT_DB_PATH"] = os.path.join(WORKDIR, "bot.db")
+    os.environ["EXTRACTOR_BACKEND"] = "thread"
+
+
+def install_fake_yt_dlp(info_dicts: list) -> None:
+    """Put a yt_dlp into sys.modules whose extractor replays recorded info dicts."""
+    by_id = {info['id']: info for info in info_dicts}
+    video_id_regex = re.compile(r'(?:[?&]v=|/shorts/|youtu\.be/)([0-9A-Za-z_-]{11})')
+    playlist_id_regex = re.compile(r'[?&]list=([0-9A-Za-z_-]+)')
+
+    class YoutubeDLError(Exception):
+        pass
+
+    class DownloadError(YoutubeDLError):
+        exc_info = None
+
+    class YoutubeDL:
+        def __init__(self, params=None):
+            self.params = params or {}
+
+        def add_progress_hook(self, hook):
+            pass
+
+        def add_postprocessor_hook(self, hook):
+            pass
+
+        def extract_info(self, url, download=False, process=True):
+            playlist = playlist_id_regex.search(url)
+            if playlist and 'v=' not in url:
+                return {'id': playlist.group(1), '_type': 'playlist',
+                        'entries': [{'id': info['id'], 'url': info['webpage_url']} for info in info_dicts]}
+            match = video_id_regex.search(url)
+            if match is None:
+                raise YoutubeDLError(f"Unsupported URL: {url}")
+            # Unknown ids replay the first recording, so benchmarks can use fresh ids
+            info = copy.deepcopy(by_id.get(match.group(1), info_dicts[0]))
+            info['id'] = match.group(1)
+            return info
+
+    utils = types.ModuleType('yt_dlp.utils')
+    utils.YoutubeDLError = YoutubeDLError
+    utils.DownloadError = DownloadError
+    module = types.ModuleType('yt_dlp')
+    module.YoutubeDL = YoutubeDL
+    module.utils = utils
+    sys.modules['yt_dlp'] = module
+    sys.modules['yt_dlp.utils'] = utils
+
+
+def summarize(samples: list) -> dict:
+    """Seconds per operation of each round -> summary statistics."""
+    samples = sorted(samples)
+    mean = statistics.fmean(samples)
+    return {
+        'rounds': len(samples),
+        'mean_s': mean,
+        'median_s': statistics.median(samples),
+        'p99_s': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        'ops_per_s': 1 / mean if mean else None,
+    }
+
+
+def measure(func, rounds: int, inner: int = 1) -> dict:
+    """Time `inner` calls of func per round; fast functions need many per round."""
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(inner):
+            func()
+        samples.append((time.perf_counter() - started) / inner)
+    return summarize(samples)
+
+
+async def measure_async(func, rounds: int, inner: int = 1) -> dict:
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(inner):
+            await func()
+        samples.append((time.perf_counter() - started) / inner)
+    return summarize(samples)
+
+
+def make_stub_bot():
+    from aiogram import Bot
+    from aiogram.types import Chat, Message
+
+    class StubBot(Bot):
+        """Answers every API method the way Telegram would, without a network, and counts the calls."""
+
+        def __init__(self) -> None:
+            super().__init__(token=os.environ["API_TOKEN"])
+            self.calls = Counter()
+            self._message_ids = itertools.count(1)
+
+        async def __call__(self, method, request_timeout=None):
+            name = type(method).__name__
+            self.calls[name] += 1
+            if name.startswith(('Send', 'Edit')):
+                chat_id = getattr(method, 'chat_id', None)
+                return Message(
+                    message_id=next(self._message_ids), date=datetime.datetime.now(),
+                    chat=Chat(id=chat_id if isinstance(chat_id, int) else USER_ID, type='private'),
+                ).as_(self)
+            return True
+
+    return StubBot()
+
+
+def make_update(update_id: int, text: str):
+    from aiogram.types import Chat, Message, Update, User
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id,
+        date=datetime.datetime.now(),
+        chat=Chat(id=USER_ID, type='private'),
+        from_user=User(id=USER_ID, is_bot=False, first_name='bench'),
+        text=text,
+    ))
+
+
+# ------------------------- Benchmarks -------------------------
+# Each takes the scale factor and returns {result name: summary}.
+
+async def bench_botdb(scale: float) -> dict:
+    from db.database import BotDB
+    db = BotDB()
+    n = max(1, int(200 * scale))
+    user_ids = itertools.count(10 ** 6)
+    link_ids = itertools.count()
+    blob_keys = itertools.count()
+    await db.add_user(USER_ID, 'bench', 'fa')
+    await db.add_file_blob('dQw4w9WgXcQ__video__720p', 'dQw4w9WgXcQ', 'video', '720p', 'title',
+                           'cover', 'mp4', os.path.join(WORKDIR, 'blob.mp4'), 1024)
+    info = json.load(open(FIXTURES))[0]
+
+    async def job_cycle():
+        await db.enqueue_download_job(USER_ID, 'interactive', {'video_url': 'x', 'format_id': '136',
+                                                              'resolution': '720p', 'type': 'video'})
+        job = await db.lease_download_job('bench', ('interactive', 'bulk'), 60, 10 ** 6)
+        await db.finish_download_job(job['id'], 'bench', 'done', result={'status': 'success'})
+
+    results = {
+        'add_user': await measure_async(lambda: db.add_user(next(user_ids), 'bench', 'en'), n),
+        'get_user_lang_cached': await measure_async(lambda: db.get_user_lang(USER_ID), n, 50),
+        'add_or_update_youtube_link_queued': await measure_async(
+            lambda: db.add_or_update_youtube_link(USER_ID, f'v{next(link_ids):010d}', 'title'), n, 10),
+        'add_or_update_youtube_link_durable': await measure_async(
+            lambda: db.add_or_update_youtube_link(USER_ID, f'v{next(link_ids):010d}', 'title', durable=True), n),
+        'get_file_blob_hit': await measure_async(lambda: db.get_file_blob('dQw4w9WgXcQ__video__720p'), n),
+        'get_file_blob_miss': await measure_async(lambda: db.get_file_blob(f'missing{next(blob_keys)}'), n),
+        'download_job_cycle': await measure_async(job_cycle, n),
+        'put_video_info': await measure_async(lambda: db.put_video_info(f'i{next(blob_keys):010d}', info), n),
+    }
+    await db.flush()
+    results['get_video_info'] = await measure_async(lambda: db.get_video_info('i0000000000', 3600), n)
+    return results
+
+
+async def bench_video_details(scale: float) -> dict:
+    from workers.extractor import compact_video_info
+    from workers.yt_dl import get_video_details, metadata_cache, _video_details, build_format_table
+    n = max(1, int(200 * scale))
+    info_dicts = json.load(open(FIXTURES))
+    compact = [compact_video_info(info) for info in info_dicts]
+    fresh_ids = (f'b{index:010d}' for index in itertools.count())
+    url = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+    await get_video_details(url)
+
+    async def from_store():
+        metadata_cache.invalidate('dQw4w9WgXcQ')
+        await get_video_details(url)
+
+    return {
+        'compact_video_info': measure(lambda: [compact_video_info(info) for info in info_dicts], n),
+        'build_format_table': measure(
+            lambda: [build_format_table(info['formats'], info['duration']) for info in compact], n, 10),
+        'video_details': measure(lambda: [_video_details(info) for info in compact], n, 10),
+        'get_video_details_cached': await measure_async(lambda: get_video_details(url), n, 50),
+        'get_video_details_from_store': await measure_async(from_store, n),
+        'get_video_details_extracted': await measure_async(
+            lambda: get_video_details(f'https://www.youtube.com/watch?v={next(fresh_ids)}'), n),
+    }
+
+
+async def bench_urls(scale: float) -> dict:
+    from workers.yt_dl import is_valid_youtube_url, is_youtube_playlist, extract_video_id
+    n = max(1, int(200 * scale))
+    return {
+        'is_valid_youtube_url': measure(lambda: [is_valid_youtube_url(url) for url in URLS], n, 100),
+        'is_youtube_playlist': measure(lambda: [is_youtube_playlist(url) for url in URLS], n, 100),
+        'extract_video_id': measure(lambda: [extract_video_id(url) for url in URLS], n, 100),
+    }
+
+
+async def bench_translator(scale: float) -> dict:
+    from i18n.i18n import get_translator
+    n = max(1, int(200 * scale))
+    return {
+        'get_translator': measure(lambda: (get_translator('fa'), get_translator('en')), n, 500),
+        'translate_fa': measure(lambda: get_translator('fa')('Please choose your preferred quality:'), n, 500),
+    }
+
+
+async def bench_keyboards(scale: float) -> dict:
+    from keyboard.keys import get_keyboard
+    from workers.download_link import build_quality_keyboard
+    from workers.extractor import compact_video_info
+    from workers.yt_dl import _video_details
+    n = max(1, int(200 * scale))
+    details = _video_details(compact_video_info(json.load(open(FIXTURES))[0]))
+    return {
+        'reply_keyboard': measure(lambda: (get_keyboard('fa'), get_keyboard('en')), n, 500),
+        'quality_keyboard': await measure_async(lambda: build_quality_keyboard(USER_ID, details, 1), n, 10),
+    }
+
+
+async def bench_dispatch(scale: float) -> dict:
+    import app
+    from db.database import BotDB
+    n = max(1, int(100 * scale))
+    bot = make_stub_bot()
+    await BotDB().add_user(USER_ID, 'bench', 'en')
+    update_ids = itertools.count(1)
+    results = {}
+    for name, text in (
+        ('handle_links_video', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'),
+        ('handle_links_playlist', 'https://www.youtube.com/playlist?list=PL590L5WQmH8fJ54F369BLDSqIwcs-TCfs'),
+        ('handle_links_invalid', 'https://vimeo.com/76979871'),
+    ):
+        # Warm the metadata caches; what is measured is the bot's own work
+        await app.dp.feed_update(bot, make_update(next(update_ids), text))
+        bot.calls.clear()
+        results[name] = await measure_async(lambda: app.dp.feed_update(bot, make_update(next(update_ids), text)), n)
+        results[name]['api_calls_per_update'] = {method: count / n for method, count in sorted(bot.calls.items())}
+    return results
+
+
+BENCHMARKS = {
+    'botdb': bench_botdb,
+    'video_details': bench_video_details,
+    'urls': bench_urls,
+    'translator': bench_translator,
+    'keyboards': bench_keyboards,
+    'dispatch': bench_dispatch,
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+async def run(names: list, scale: float) -> dict:
+    from db.database import BotDB
+    from workers.extractor import start_extractor_pool, shutdown_extractor_pool
+    start_extractor_pool()
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': scale,
+        'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'results': {},
+    }
+    try:
+        for name in names:
+            for result, summary in (await BENCHMARKS[name](scale)).items():
+                report['results'][f'{name}.{result}'] = summary
+    finally:
+        shutdown_extractor_pool()
+        BotDB().close()
+    return report
+
+
+def print_report(report: dict, baseline: dict = None) -> None:
+    header = f"{'benchmark':<50}{'median':>12}{'p99':>12}{'ops/s':>12}"
+    print(header + (f"{'vs ' + baseline['commit']:>14}" if baseline else ''))
+    for name, summary in report['results'].items():
+        line = (f"{name:<50}{summary['median_s'] * 1e6:>10.1f}us{summary['p99_s'] * 1e6:>10.1f}us"
+                f"{summary['ops_per_s']:>12.0f}")
+        previous = (baseline or {}).get('results', {}).get(name)
+        if previous:
+            line += f"{summary['median_s'] / previous['median_s']:>13.2f}x"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='results file of an earlier run to compare medians against')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='run only these benchmarks')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies the number of rounds')
+    args = parser.parse_args()
+
+    prepare_environment()
+    install_fake_yt_dlp(json.load(open(FIXTURES)))
+    # Keep the bot's per-request logging out of the timings
+    logging.disable(logging.INFO)
+    try:
+        report = asyncio.run(run(args.only or list(BENCHMARKS), args.scale))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    baseline = json.load(open(args.compare)) if args.compare else None
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Throughput of the SQLite download job queue with 1, 2 and 4 worker processes.
+
+Each job is a CPU-bound stand-in for a download's processing (a busy loop of
+WORK_MS milliseconds). Workers lease, "run" and finish jobs through the same
+BotDB methods the download workers use, against a throwaway database, so the
+numbers show how throughput grows with worker processes and what the queue
+itself costs.
+
+    python benchmarks/bench_job_queue.py [jobs] [work_ms]
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("ADMIN_IDS", "0")
+os.environ.setdefault("DOWNLOAD_DIR", "/tmp/bench-downloads/")
+os.environ.setdefault("BOT_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-"), "bot.db"))
+
+JOBS = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+WORK_MS = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+
+def burn(ms: float) -> None:
+    # CPU time, not wall time, so workers sharing a core do not count double.
+    deadline = time.process_time() + ms / 1000
+    while time.process_time() < deadline:
+        pass
+
+
+def worker(db_path: str, worker_id: str) -> None:
+    os.environ["BOT_DB_PATH"] = db_path
+    from db.database import BotDB
+
+    db = BotDB()
+
+    async def run() -> None:
+        while True:
+            job = await db.lease_download_job(worker_id, ('interactive', 'bulk'), 60, 10 ** 6)
+            if job is None:
+                return
+            burn(WORK_MS)
+            await db.finish_download_job(job['id'], worker_id, 'done', result={'status': 'success'})
+
+    asyncio.run(run())
+    db.close()
+
+
+def run_round(processes: int) -> float:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bot.db")
+    from db.database import BotDB
+
+    # A fresh database per round; BOT_DB_PATH was read when config was imported.
+    db = BotDB()
+    db.bot_db_name = db_path
+    db._initialize_db()
+
+    async def fill() -> None:
+        for index in range(JOBS):
+            await db.enqueue_download_job(index % 50, 'bulk', {'n': index})
+
+    asyncio.run(fill())
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=worker, args=(db_path, f'w{index}')) for index in range(processes)]
+    started = time.perf_counter()
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    print(f"{JOBS} jobs of {WORK_MS:g} ms CPU each (ideal: {JOBS * WORK_MS / 1000:.2f}s on one core)")
+    baseline = None
+    for processes in (1, 2, 4):
+        elapsed = run_round(processes)
+        rate = JOBS / elapsed
+        baseline = baseline or rate
+        print(f"{processes} worker(s): {elapsed:6.2f}s  {rate:7.1f} jobs/s  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Per-update overhead of AutoKeyboardMiddleware.
+
+"before" reproduces the old path: a fresh SQLite connection and query for the
+user's language, then a new ReplyKeyboardMarkup. "after" is the current
+middleware with a warm user cache and prebuilt keyboards. Both run against a
+throwaway database.
+
+    python benchmarks/bench_keyboard_middleware.py [iterations]
+"""
+import asyncio
+import datetime
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("ADMIN_IDS", "0")
+os.environ.setdefault("DOWNLOAD_DIR", "/tmp/bench-downloads/")
+os.environ["BOT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bot.db")
+
+from aiogram.types import Chat, KeyboardButton, Message, ReplyKeyboardMarkup, Update, User  # noqa: E402
+from db.database import BotDB  # noqa: E402
+from keyboard.keys_middleware import AutoKeyboardMiddleware  # noqa: E402
+
+USER_ID = 1000
+
+
+def make_update() -> Update:
+    return Update(update_id=1, message=Message(
+        message_id=1,
+        date=datetime.datetime.now(),
+        chat=Chat(id=USER_ID, type="private"),
+        from_user=User(id=USER_ID, is_bot=False, first_name="bench"),
+        text="https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    ))
+
+
+async def handler(event, data):
+    return None
+
+
+async def legacy_middleware(db_path, event, data):
+    def get_user_lang(user_id):
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON;")
+        result = conn.execute("SELECT language FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return result[0] if result else "en"
+
+    loop = asyncio.get_running_loop()
+    user_lang = await loop.run_in_executor(None, get_user_lang, event.message.from_user.id)
+    buttons = [
+        [KeyboardButton(text="🌐 Change Language"), KeyboardButton(text="📘 Bot Guide")],
+        [KeyboardButton(text="🛒 Iranigram Bot")]
+    ] if user_lang == "en" else []
+    data['reply_markup'] = ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True, is_persistent=True)
+    return await handler(event, data)
+
+
+async def run(iterations: int) -> None:
+    db = BotDB()
+    await db.add_user(USER_ID, "bench", "en")
+    event = make_update()
+    middleware = AutoKeyboardMiddleware()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await legacy_middleware(db.bot_db_name, event, {})
+    before = (time.perf_counter() - start) / iterations
+
+    await middleware(handler, event, {})
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await middleware(handler, event, {})
+    after = (time.perf_counter() - start) / iterations
+
+    print(f"before: {before * 1e6:9.1f} us per update")
+    print(f"after : {after * 1e6:9.1f} us per update")
+    print(f"speedup: {before / after:6.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
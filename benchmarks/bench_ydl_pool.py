@@ -0,0 +1,51 @@
+"""
+Per-call YoutubeDL setup cost: a fresh YoutubeDL(opts) per call, as the bot
+used to do, against checking an instance out of the pool. No network access
+is needed; only construction and checkout are timed.
+
+    python benchmarks/bench_ydl_pool.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("ADMIN_IDS", "0")
+os.environ.setdefault("DOWNLOAD_DIR", "/tmp/bench-downloads/")
+
+import yt_dlp  # noqa: E402
+from workers.ydl_pool import YoutubeDLPool, profile_opts, METADATA, audio_profile, video_profile  # noqa: E402
+
+PROFILES = (METADATA, audio_profile('128kbps'), video_profile('720p'))
+
+
+def bench_fresh(iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        yt_dlp.YoutubeDL(profile_opts(PROFILES[i % len(PROFILES)]))
+    return (time.perf_counter() - start) / iterations
+
+
+def bench_pooled(iterations: int) -> float:
+    pool = YoutubeDLPool(max_idle_per_profile=4)
+    for profile in PROFILES:
+        with pool.checkout(profile):
+            pass
+    start = time.perf_counter()
+    for i in range(iterations):
+        with pool.checkout(PROFILES[i % len(PROFILES)]):
+            pass
+    return (time.perf_counter() - start) / iterations
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    fresh = bench_fresh(iterations)
+    pooled = bench_pooled(iterations * 100)
+    print(f"fresh YoutubeDL per call : {fresh * 1e3:9.3f} ms")
+    print(f"pooled checkout per call : {pooled * 1e3:9.3f} ms")
+    print(f"setup overhead removed   : {(fresh - pooled) * 1e3:9.3f} ms per call")
+
+
+if __name__ == "__main__":
+    main()
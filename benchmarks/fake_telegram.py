@@ -0,0 +1,121 @@
+"""
+Local fake Telegram for exercising webhook mode.
+
+It serves a stand-in Bot API, which answers every method with a plausible
+result and counts the calls, and it posts synthetic updates to the bot's
+webhook. It reports webhook ack latency and the time until the bot's
+replies stop arriving. Start the bot against it with:
+
+    BOT_MODE=webhook WEBHOOK_SECRET=s TELEGRAM_API_SERVER=http://127.0.0.1:8081 python src/main.py
+
+then run:
+
+    python benchmarks/fake_telegram.py --updates 1000 --concurrency 50 --secret s
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from collections import Counter
+
+from aiohttp import ClientSession, web
+
+calls: Counter = Counter()
+_message_ids = itertools.count(1)
+
+
+async def bot_api(request: web.Request) -> web.Response:
+    method = request.match_info['method']
+    calls[method] += 1
+    form = await request.post()
+    chat_id = int(form.get('chat_id') or 0)
+    if method.lower() == 'getme':
+        result = {'id': 1, 'is_bot': True, 'first_name': 'fake', 'username': 'fake_bot'}
+    elif method.lower().startswith(('send', 'edit', 'copy')):
+        result = {'message_id': next(_message_ids), 'date': int(time.time()),
+                  'chat': {'id': chat_id, 'type': 'private'}, 'text': ''}
+    else:
+        result = True
+    return web.json_response({'ok': True, 'result': result})
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': user,
+            'text': text,
+        },
+    }
+
+
+async def send_updates(args: argparse.Namespace) -> None:
+    headers = {'X-Telegram-Bot-Api-Secret-Token': args.secret} if args.secret else {}
+    latencies, statuses = [], Counter()
+    queue: asyncio.Queue = asyncio.Queue()
+    for update_id in range(1, args.updates + 1):
+        queue.put_nowait(make_update(update_id, 1000 + update_id % args.users, args.text))
+
+    async def sender(session: ClientSession) -> None:
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            async with session.post(args.webhook, json=update, headers=headers) as response:
+                await response.read()
+                statuses[response.status] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(args.concurrency)))
+    sent_in = time.perf_counter() - started
+
+    # Handlers run after the ack; wait until the bot stops calling the API.
+    last, idle_since = -1, time.perf_counter()
+    while time.perf_counter() - idle_since < args.settle:
+        total = sum(calls.values())
+        if total != last:
+            last, idle_since = total, time.perf_counter()
+        await asyncio.sleep(0.05)
+    handled_in = idle_since - started
+
+    latencies.sort()
+    print(f"updates sent:     {args.updates} in {sent_in:.2f}s ({args.updates / sent_in:.0f}/s)")
+    print(f"ack status codes: {dict(statuses)}")
+    print(f"ack latency:      p50 {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+    print(f"bot API calls:    {sum(calls.values())} {dict(calls)}")
+    print(f"all handled in:   {handled_in:.2f}s")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--webhook', default='http://127.0.0.1:8000/webhook')
+    parser.add_argument('--secret', default='')
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--updates', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--text', default='/help')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='seconds without bot API calls before handling counts as done')
+    args = parser.parse_args()
+
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', bot_api)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', args.api_port).start()
+    try:
+        await send_updates(args)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""The bot: its dispatcher, routers and background tasks. Started by main.py."""
+from handlers import start, help, links, language, other_bot
+from handlers.admin import stats
+from aiogram import Bot, Dispatcher, Router
+import asyncio
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from config import API_TOKEN, BOT_MODE, TELEGRAM_API_SERVER, EMBEDDED_WORKER
+from db.database import BotDB
+from tools.handle_old_files import run_delete_files_periodically
+from workers import download_link, download_playlist, process_file_links
+from keyboard.keys_middleware import AutoKeyboardMiddleware
+from workers.extractor import start_extractor_pool, shutdown_extractor_pool
+from tools.webhook import run_webhook
+from workers.job_queue import DownloadWorker
+from workers.bulk_jobs import resume_bulk_jobs
+
+db = BotDB()
+
+# Initialize bot and dispatcher
+if TELEGRAM_API_SERVER:
+    bot = Bot(token=API_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER)))
+else:
+    bot = Bot(token=API_TOKEN)
+dp = Dispatcher()
+
+router = Router()
+
+# Add middleware
+dp.update.middleware(AutoKeyboardMiddleware())
+
+dp.include_router(start.router)
+dp.include_router(language.router)
+dp.include_router(other_bot.router)
+dp.include_router(help.router)
+dp.include_router(stats.router)
+dp.include_router(links.router)
+dp.include_router(download_link.router)
+dp.include_router(download_playlist.router)
+dp.include_router(process_file_links.router)
+
+
+async def main():
+    start_extractor_pool()
+    asyncio.create_task(run_delete_files_periodically(db))
+    if EMBEDDED_WORKER:
+        asyncio.create_task(DownloadWorker().run())
+    asyncio.create_task(resume_bulk_jobs(bot))
+    try:
+        if BOT_MODE == 'webhook':
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        shutdown_extractor_pool()
+        db.close()
+
+def run() -> None:
+    db._initialize_db()
+    asyncio.run(main())
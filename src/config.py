@@ -8,4 +8,119 @@ DOWNLOAD_DIR = os.getenv('DOWNLOAD_DIR')
 DOMAIN = os.getenv('DOMAIN')
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 IMAGE_DIR = os.path.join(BASE_DIR, "images")
-ADMIN_IDS = [int(i) for i in os.getenv("ADMIN_IDS").split(",")]
\ No newline at end of file
+# Defaults to database/bot.db in the project root
+BOT_DB_PATH = os.getenv('BOT_DB_PATH')
+ADMIN_IDS = [int(i) for i in os.getenv("ADMIN_IDS").split(",")]
+
+# Shared, content-addressed download store. It lives under DOWNLOAD_DIR so the
+# per-user hardlinks stay on the same filesystem; whatever serves DOWNLOAD_DIR
+# must refuse requests for it (see docker/nginx/default.conf).
+STORE_DIR = os.getenv('STORE_DIR') or os.path.join(DOWNLOAD_DIR or '', '.store')
+
+# In-process cache for yt_dlp metadata extraction
+METADATA_CACHE_SIZE = int(os.getenv('METADATA_CACHE_SIZE', 512))
+METADATA_CACHE_TTL = int(os.getenv('METADATA_CACHE_TTL', 1800))
+# Compressed info dicts kept in the database behind that cache, so metadata
+# survives restarts: how long an entry is used and the table's size budget
+VIDEO_INFO_TTL = int(os.getenv('VIDEO_INFO_TTL', 86400))
+VIDEO_INFO_MAX_BYTES = int(float(os.getenv('VIDEO_INFO_MAX_MB', 64)) * 1024 ** 2)
+
+# Write-behind queue for youtube_links updates
+WRITE_QUEUE_MAX_BATCH = int(os.getenv('WRITE_QUEUE_MAX_BATCH', 200))
+WRITE_QUEUE_MAX_DELAY_MS = int(os.getenv('WRITE_QUEUE_MAX_DELAY_MS', 50))
+
+# Download workers: concurrent downloads per worker process, jobs per user and
+# lane across all workers, and slots kept free for interactive single-video
+# requests.
+DOWNLOAD_MAX_CONCURRENT = int(os.getenv('DOWNLOAD_MAX_CONCURRENT', 4))
+DOWNLOAD_MAX_PER_USER = int(os.getenv('DOWNLOAD_MAX_PER_USER', 2))
+DOWNLOAD_INTERACTIVE_RESERVED = int(os.getenv('DOWNLOAD_INTERACTIVE_RESERVED', 1))
+
+# Number of playlist items extracted and downloaded at the same time
+PLAYLIST_CONCURRENCY = int(os.getenv('PLAYLIST_CONCURRENCY', 3))
+
+# Where yt_dlp metadata extraction runs: 'thread' (default) or 'process',
+# which keeps the CPU-bound parsing off the bot's GIL.
+EXTRACTOR_BACKEND = os.getenv('EXTRACTOR_BACKEND', 'thread')
+EXTRACTOR_PROCESSES = int(os.getenv('EXTRACTOR_PROCESSES', 2))
+
+# Idle YoutubeDL instances kept per option profile
+YDL_POOL_MAX_IDLE = int(os.getenv('YDL_POOL_MAX_IDLE', 4))
+
+# Users whose profile (language, username) is kept in memory
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+
+# Expiry sweeper: link lifetime, how often it runs and rows handled per page
+LINK_TTL_SECONDS = int(os.getenv('LINK_TTL_SECONDS', 3600))
+SWEEP_INTERVAL = int(os.getenv('SWEEP_INTERVAL', 300))
+SWEEP_PAGE_SIZE = int(os.getenv('SWEEP_PAGE_SIZE', 500))
+
+# Disk budget of the download store. Above the high watermark the least
+# recently served files (or least served, with policy 'lfu') are evicted until
+# usage drops under the low watermark.
+STORAGE_HIGH_WATERMARK = int(float(os.getenv('STORAGE_HIGH_WATERMARK_GB', 20)) * 1024 ** 3)
+STORAGE_LOW_WATERMARK = int(float(os.getenv('STORAGE_LOW_WATERMARK_GB', 16)) * 1024 ** 3)
+STORAGE_EVICTION_POLICY = os.getenv('STORAGE_EVICTION_POLICY', 'lru')
+# Seconds a new download may wait for space before it is rejected
+STORAGE_ADMIT_TIMEOUT = int(os.getenv('STORAGE_ADMIT_TIMEOUT', 120))
+# Space reserved for a download whose size is not known up front
+STORAGE_DEFAULT_VIDEO_BYTES = int(os.getenv('STORAGE_DEFAULT_VIDEO_BYTES', 200 * 1024 ** 2))
+STORAGE_DEFAULT_AUDIO_BYTES = int(os.getenv('STORAGE_DEFAULT_AUDIO_BYTES', 15 * 1024 ** 2))
+# Files estimated above this size are not offered or downloaded
+STORAGE_MAX_FILE_BYTES = int(float(os.getenv('STORAGE_MAX_FILE_GB', 2)) * 1024 ** 3)
+
+# Reconciliation of DOWNLOAD_DIR against the database: directories visited per
+# sweep, and how old an untracked file must be before it is removed.
+RECONCILE_DIRS_PER_RUN = int(os.getenv('RECONCILE_DIRS_PER_RUN', 50))
+RECONCILE_GRACE_SECONDS = int(os.getenv('RECONCILE_GRACE_SECONDS', 3600))
+
+# Rows written and read per batch by bulk .txt jobs
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', 500))
+
+# How updates reach the bot: 'polling' (default) or 'webhook'. In webhook mode
+# an aiohttp server listens on WEBHOOK_HOST:WEBHOOK_PORT; WEBHOOK_URL is the
+# public base URL registered with Telegram (left unset, the webhook is assumed
+# to be registered already).
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8000))
+# Updates handled at once; beyond that a request waits up to
+# WEBHOOK_BUSY_TIMEOUT seconds for a slot, then Telegram is told to retry.
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv('WEBHOOK_MAX_IN_FLIGHT', 100))
+WEBHOOK_BUSY_TIMEOUT = float(os.getenv('WEBHOOK_BUSY_TIMEOUT', 5))
+# Alternative Bot API server, e.g. a local telegram-bot-api or a test fake
+TELEGRAM_API_SERVER = os.getenv('TELEGRAM_API_SERVER')
+
+# Durable download job queue. A worker holds a job for JOB_LEASE_SECONDS and
+# renews the lease while it runs; jobs whose lease runs out go back to the
+# queue until they have been tried JOB_MAX_ATTEMPTS times.
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 60))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 0.5))
+# Run a download worker inside the bot process (set to 0 when separate
+# `python worker.py` processes do the downloading)
+EMBEDDED_WORKER = os.getenv('EMBEDDED_WORKER', '1') == '1'
+# Worker processes started by worker.py
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', 2))
+
+# Download progress: a status message is edited at most once every
+# PROGRESS_EDIT_INTERVAL seconds per chat, to stay clear of Telegram's limits.
+PROGRESS_EDIT_INTERVAL = float(os.getenv('PROGRESS_EDIT_INTERVAL', 3))
+
+# How videos above the progressive formats are fetched: 'dash' downloads the
+# video-only and audio streams in parallel and merges them with a stream copy;
+# 'progressive' only takes formats that already carry both.
+VIDEO_DOWNLOAD_MODE = os.getenv('VIDEO_DOWNLOAD_MODE', 'dash')
+
+# ffmpeg post-processing (MP3 encodes, audio remuxes, DASH merges) runs in a
+# pool in each downloading process. POSTPROCESS_CORES cores of the machine are
+# split evenly between POSTPROCESS_PROCESSES such processes (worker.py sets it
+# to the number it starts) and shared by jobs of POSTPROCESS_THREADS ffmpeg
+# threads each, at niceness POSTPROCESS_NICE.
+POSTPROCESS_CORES = int(os.getenv('POSTPROCESS_CORES', os.cpu_count() or 1))
+POSTPROCESS_PROCESSES = int(os.getenv('POSTPROCESS_PROCESSES', 1))
+POSTPROCESS_THREADS = int(os.getenv('POSTPROCESS_THREADS', 1))
+POSTPROCESS_NICE = int(os.getenv('POSTPROCESS_NICE', 10))
@@ -1,5 +1,46 @@
 import sqlite3
 
+YOUTUBE_LINKS_TABLE = '''CREATE TABLE IF NOT EXISTS youtube_links (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        video_id TEXT NOT NULL,
+        title TEXT,
+        extension TEXT,
+        status TEXT,
+        file_path TEXT,
+        download_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        cache_key TEXT NOT NULL DEFAULT '',
+        UNIQUE(user_id, video_id, cache_key)
+    )'''
+
+
+def _table_columns(cursor, table_name):
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def _add_missing_columns(cursor, table_name, columns):
+    existing = _table_columns(cursor, table_name)
+    for name, declaration in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {name} {declaration}")
+
+
+def _migrate_youtube_links(cursor):
+    # Older databases keyed youtube_links on video_id alone, so only one user
+    # could ever reference a video. Rebuild the table with per-user rows.
+    columns = _table_columns(cursor, "youtube_links")
+    if not columns or "cache_key" in columns:
+        return
+    cursor.execute("ALTER TABLE youtube_links RENAME TO youtube_links_old")
+    cursor.execute(YOUTUBE_LINKS_TABLE)
+    cursor.execute('''INSERT INTO youtube_links
+                        (id, user_id, video_id, title, extension, status, file_path, download_time)
+                      SELECT id, user_id, video_id, title, extension, status, file_path, download_time
+                      FROM youtube_links_old''')
+    cursor.execute("DROP TABLE youtube_links_old")
+
+
 def initialize_db(db_path):
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
@@ -10,16 +51,98 @@ def initialize_db(db_path):
                 username TEXT,
                 language TEXT
             )''')
-    cursor.execute('''CREATE TABLE IF NOT EXISTS youtube_links (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
+    _migrate_youtube_links(cursor)
+    cursor.execute(YOUTUBE_LINKS_TABLE)
+    # Shared download store: one blob per (video, type, quality), hardlinked
+    # into each requesting user's directory.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS file_blobs (
+        cache_key TEXT PRIMARY KEY,
         video_id TEXT NOT NULL,
+        type TEXT NOT NULL,
+        quality TEXT NOT NULL,
         title TEXT,
+        cover_url TEXT,
         extension TEXT,
-        status TEXT,
-        file_path TEXT,
-        download_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        UNIQUE(video_id)
+        blob_path TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        file_size INTEGER,
+        last_served TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        serve_count INTEGER NOT NULL DEFAULT 0
+    )''')
+    _add_missing_columns(cursor, "file_blobs", {
+        "file_size": "INTEGER",
+        "last_served": "TIMESTAMP",
+        "serve_count": "INTEGER NOT NULL DEFAULT 0",
+    })
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_file_blobs_last_served
+                      ON file_blobs (last_served)''')
+    # Bulk .txt uploads: one job per file, one item per distinct video.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS bulk_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        chat_id INTEGER,
+        status TEXT NOT NULL DEFAULT 'ingesting',
+        resolution TEXT,
+        total INTEGER NOT NULL DEFAULT 0,
+        duplicates INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        kind TEXT NOT NULL DEFAULT 'file'
+    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS bulk_job_items (
+        job_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        video_id TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        file_url TEXT,
+        download_job_id INTEGER,
+        PRIMARY KEY (job_id, position),
+        UNIQUE (job_id, video_id)
+    )''')
+    _add_missing_columns(cursor, "bulk_jobs", {"kind": "TEXT NOT NULL DEFAULT 'file'"})
+    _add_missing_columns(cursor, "bulk_job_items", {"download_job_id": "INTEGER"})
+    # Durable download queue shared by the bot and the download workers.
+    # Times are Unix timestamps so leases can be compared across processes.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS download_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        lane TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        worker_id TEXT,
+        lease_expires_at REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    )''')
+    # Latest yt_dlp progress of a leased job, for waiters in other processes
+    _add_missing_columns(cursor, "download_jobs", {"progress": "TEXT"})
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_download_jobs_status
+                      ON download_jobs (status, lane, user_id)''')
+    # Store files being fetched, one row per cache key: a claim that keeps
+    # download processes from fetching the same file into the same paths.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS blob_fetches (
+        cache_key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )''')
+    # Bytes of the storage budget the fetch holds, so admission control
+    # sees the downloads running in every process
+    _add_missing_columns(cursor, "blob_fetches", {"reserved_bytes": "INTEGER NOT NULL DEFAULT 0"})
+    # Compact yt_dlp info dicts, zlib-compressed JSON; second-level metadata cache
+    cursor.execute('''CREATE TABLE IF NOT EXISTS video_info (
+        video_id TEXT PRIMARY KEY,
+        info BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        stored_at REAL NOT NULL
     )''')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_video_info_stored_at
+                      ON video_info (stored_at)''')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_youtube_links_cache_key
+                      ON youtube_links (cache_key, status)''')
+    # Drives the expiry sweeper
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_youtube_links_status_time
+                      ON youtube_links (status, download_time)''')
     conn.commit()
-    conn.close()
\ No newline at end of file
+    conn.close()
@@ -1,35 +1,112 @@
 from concurrent.futures import ThreadPoolExecutor
 import sqlite3
 import asyncio
-from typing import Any, List, Tuple
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 from db.botdb_schema import initialize_db
+from db.write_queue import WriteQueue
+from config import BOT_DB_PATH, WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_MAX_DELAY_MS, USER_CACHE_SIZE
+from tools.cache import LRUCache
+from tools.request_context import get_context_lang, set_context_lang
+import atexit
+import json
 import os
+import time
+import zlib
 from tools.logger import logger
 import csv
 
+# Applied once to every pooled connection.
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON;",
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA busy_timeout = 5000;",
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA mmap_size = 268435456;",  # 256 MB
+    "PRAGMA cache_size = -16000;",    # ~16 MB
+)
+
+# Shared by every BotDB instance, so the number of open handles is bounded
+# by the executor size rather than by how many modules create a BotDB.
+_executor = ThreadPoolExecutor(max_workers=5, thread_name_prefix="botdb")
+_local = threading.local()
+_connections: List[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+_initialized_paths = set()
+_pool_generation = 0
+_write_queue: Optional[WriteQueue] = None
+# Shared by every BotDB instance and kept up to date by the user writes below.
+_user_cache = LRUCache(maxsize=USER_CACHE_SIZE)
+
+
+def _get_write_queue(connect) -> WriteQueue:
+    global _write_queue
+    with _connections_lock:
+        if _write_queue is None or _write_queue.closed:
+            _write_queue = WriteQueue(
+                connect,
+                max_batch=WRITE_QUEUE_MAX_BATCH,
+                max_delay=WRITE_QUEUE_MAX_DELAY_MS / 1000,
+            )
+            # Flush-on-shutdown guarantee, even if close() is never reached.
+            atexit.register(_write_queue.close)
+        return _write_queue
+
+
 class BotDB:
     def __init__(self) -> None:
         self.base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-        self.bot_db_name = os.path.join(self.base_dir, "database", "bot.db")
-        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=5)
+        self.bot_db_name = BOT_DB_PATH or os.path.join(self.base_dir, "database", "bot.db")
+        self.executor: ThreadPoolExecutor = _executor
         self._initialize_db()
 
     def _initialize_db(self):
-        initialize_db(self.bot_db_name)
-        conn = sqlite3.connect(self.bot_db_name)
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.close()
-
-    def _get_connection(self):
-        conn = sqlite3.connect(self.bot_db_name, check_same_thread=False)
-        conn.execute("PRAGMA foreign_keys = ON;")
+        with _connections_lock:
+            if self.bot_db_name in _initialized_paths:
+                return
+            initialize_db(self.bot_db_name)
+            _initialized_paths.add(self.bot_db_name)
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Return this thread's long-lived connection, opening it on first use."""
+        connections = getattr(_local, "connections", None)
+        if connections is None or getattr(_local, "generation", None) != _pool_generation:
+            connections = _local.connections = {}
+            _local.generation = _pool_generation
+        conn = connections.get(self.bot_db_name)
+        if conn is None:
+            conn = sqlite3.connect(self.bot_db_name, check_same_thread=False, cached_statements=256)
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            connections[self.bot_db_name] = conn
+            with _connections_lock:
+                _connections.append(conn)
         return conn
+
+    @property
+    def write_queue(self) -> WriteQueue:
+        return _get_write_queue(self._get_connection)
+
+    def close(self) -> None:
+        """Flush queued writes and close every pooled connection. Only call this on shutdown."""
+        global _pool_generation
+        if _write_queue is not None:
+            _write_queue.close()
+        with _connections_lock:
+            while _connections:
+                _connections.pop().close()
+            _pool_generation += 1
+
     # ------------------------- User Methods -------------------------
 
     async def add_user(self, user_id: int, username: str, language: str) -> None:
         if not await self.user_exists(user_id):
             loop = asyncio.get_running_loop()
             await loop.run_in_executor(self.executor, self._add_user, user_id, username, language)
+            _user_cache.set(int(user_id), {'exists': True, 'language': language, 'username': username})
+            if get_context_lang(int(user_id))[0]:
+                set_context_lang(int(user_id), language)
 
     def _add_user(self, user_id: int, username: str, language: str) -> None:
         conn = self._get_connection()
@@ -38,19 +115,35 @@ class BotDB:
                         (user_id, username, language))
         conn.commit()
 
-    async def user_exists(self, user_id: int) -> bool:
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(self.executor, self._user_exists, user_id)
+    async def get_user_profile(self, user_id: int) -> Dict[str, Any]:
+        """Return {'exists', 'language', 'username'}, from the cache when warm."""
+        profile = _user_cache.get(int(user_id))
+        if profile is None:
+            loop = asyncio.get_running_loop()
+            profile = await loop.run_in_executor(self.executor, self._get_user_profile, user_id)
+            # A write that landed while we were reading wins over the read.
+            profile = _user_cache.setdefault(int(user_id), profile)
+        return profile
 
-    def _user_exists(self, user_id: int) -> bool:
+    def _get_user_profile(self, user_id: int) -> Dict[str, Any]:
         conn = self._get_connection()
         cursor = conn.cursor()
-        cursor.execute('''SELECT COUNT(*) FROM users WHERE user_id = ?''', (user_id,))
-        return cursor.fetchone()[0] > 0
+        cursor.execute('''SELECT language, username FROM users WHERE user_id = ?''', (user_id,))
+        result = cursor.fetchone()
+        if result is None:
+            return {'exists': False, 'language': None, 'username': None}
+        return {'exists': True, 'language': result[0], 'username': result[1]}
+
+    async def user_exists(self, user_id: int) -> bool:
+        return (await self.get_user_profile(user_id))['exists']
 
     async def save_user_config(self, user_id: int, language: str) -> None:
         loop = asyncio.get_running_loop()
         await loop.run_in_executor(self.executor, self._save_user_config, user_id, language)
+        profile = _user_cache.get(int(user_id)) or {'username': None}
+        _user_cache.set(int(user_id), {'exists': True, 'language': language, 'username': profile['username']})
+        if get_context_lang(int(user_id))[0]:
+            set_context_lang(int(user_id), language)
 
     def _save_user_config(self, user_id: int, language: str) -> None:
         conn = self._get_connection()
@@ -61,51 +154,542 @@ class BotDB:
         conn.commit()
 
     async def get_user_lang(self, user_id: int) -> dict:
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(self.executor, self._get_user_lang, user_id)
+        # Already resolved for this update by the keyboard middleware
+        found, language = get_context_lang(int(user_id))
+        if found:
+            return language
+        profile = await self.get_user_profile(user_id)
+        return profile['language'] if profile['exists'] else "en"
 
-    def _get_user_lang(self, user_id: int) -> dict:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''SELECT language FROM users WHERE user_id = ?''', (user_id,))
-        result = cursor.fetchone()
-        return result[0] if result else "en"
+    def user_cache_stats(self) -> Dict[str, Any]:
+        return _user_cache.stats()
 
     # ------------------------- YouTube Links Methods -------------------------
 
     async def add_or_update_youtube_link(
         self, user_id: int, video_id: str, title: str, extension: str = None, 
-        status: str = 'pending', file_path: str = None
+        status: str = 'pending', file_path: str = None, cache_key: str = '',
+        durable: bool = False
     ) -> None:
+        """Queue an upsert; with durable=True, wait until it is committed."""
+        future = self.write_queue.submit(
+            '''INSERT INTO youtube_links (user_id, video_id, title, extension, status, file_path, cache_key)
+               VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(user_id, video_id, cache_key) DO UPDATE SET
+               title=excluded.title, extension=excluded.extension, 
+               status=excluded.status, file_path=excluded.file_path, 
+               download_time=excluded.download_time''',
+            (user_id, video_id, title, extension, status, file_path, cache_key), wait=durable)
+        if durable:
+            await asyncio.wrap_future(future)
+
+    async def update_link_status(self, user_id: int, video_id: str, status: str, durable: bool = False) -> None:
+        """Queue a status change; with durable=True, wait until it is committed."""
+        future = self.write_queue.submit(
+            '''UPDATE youtube_links SET status = ? WHERE user_id = ? AND video_id = ?''',
+            (status, user_id, video_id), wait=durable)
+        if durable:
+            await asyncio.wrap_future(future)
+
+    async def get_expired_links(
+        self, cutoff: str, after: Tuple[str, int], limit: int
+    ) -> List[Tuple[Any, ...]]:
+        """
+        One page of downloaded links older than cutoff (a UTC timestamp in
+        SQLite's format), in (download_time, id) order after the given key.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._get_expired_links, cutoff, after, limit)
+
+    def _get_expired_links(self, cutoff: str, after: Tuple[str, int], limit: int) -> List[Tuple[Any, ...]]:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        after_time, after_id = after
+        cursor.execute('''SELECT id, download_time, file_path FROM youtube_links
+                          WHERE status = 'downloaded' AND download_time < ?
+                          AND (download_time > ? OR (download_time = ? AND id > ?))
+                          ORDER BY download_time, id LIMIT ?''',
+                       (cutoff, after_time, after_time, after_id, limit))
+        return cursor.fetchall()
+
+    async def get_user_video_links(self, user_id: int, video_id: str) -> List[Tuple[int, str]]:
+        """(id, file_path) of a user's downloaded files for a video, via the UNIQUE index."""
+        return await self.execute_query_with_result(
+            '''SELECT id, file_path FROM youtube_links
+               WHERE user_id = ? AND video_id = ? AND status = 'downloaded' ''', (user_id, video_id))
+
+    async def get_user_links(self, user_id: int) -> List[Tuple[int, str]]:
+        """(id, file_path) of every downloaded file of a user."""
+        return await self.execute_query_with_result(
+            '''SELECT id, file_path FROM youtube_links
+               WHERE user_id = ? AND status = 'downloaded' ''', (user_id,))
+
+    async def mark_links_deleted(self, link_ids: List[int]) -> None:
+        """Mark links as deleted in a single transaction and wait for the commit."""
+        future = self.write_queue.submit_many(
+            '''UPDATE youtube_links SET status = 'deleted', file_path = NULL WHERE id = ?''',
+            [(link_id,) for link_id in link_ids], wait=True)
+        await asyncio.wrap_future(future)
+
+    async def flush(self) -> None:
+        """Wait until every queued write has been committed."""
+        await asyncio.wrap_future(self.write_queue.barrier())
+
+    # ------------------------- File Blob Methods -------------------------
+
+    async def get_file_blob(self, cache_key: str) -> Optional[Dict[str, Any]]:
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(self.executor, self._add_or_update_youtube_link, 
-                                   user_id, video_id, title, extension, status, file_path)
+        return await loop.run_in_executor(self.executor, self._get_file_blob, cache_key)
 
-    def _add_or_update_youtube_link(
-        self, user_id: int, video_id: str, title: str, extension: str, 
-        status: str, file_path: str
+    def _get_file_blob(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''SELECT cache_key, video_id, type, quality, title, cover_url, extension, blob_path
+                          FROM file_blobs WHERE cache_key = ?''', (cache_key,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([description[0] for description in cursor.description], row))
+
+    async def add_file_blob(
+        self, cache_key: str, video_id: str, type: str, quality: str, title: str,
+        cover_url: str, extension: str, blob_path: str, file_size: int = None
     ) -> None:
-        
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._add_file_blob, cache_key, video_id, type,
+                                   quality, title, cover_url, extension, blob_path, file_size)
+
+    def _add_file_blob(
+        self, cache_key: str, video_id: str, type: str, quality: str, title: str,
+        cover_url: str, extension: str, blob_path: str, file_size: int = None
+    ) -> None:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''INSERT INTO file_blobs (cache_key, video_id, type, quality, title, cover_url, extension,
+                                                  blob_path, file_size)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(cache_key) DO UPDATE SET
+                          title=excluded.title, cover_url=excluded.cover_url, extension=excluded.extension,
+                          blob_path=excluded.blob_path, file_size=excluded.file_size,
+                          created_at=CURRENT_TIMESTAMP, last_served=CURRENT_TIMESTAMP''',
+                       (cache_key, video_id, type, quality, title, cover_url, extension, blob_path, file_size))
+        conn.commit()
+
+    async def touch_file_blob(self, cache_key: str) -> None:
+        """Record that a blob was served; feeds LRU/LFU eviction."""
+        self.write_queue.submit(
+            '''UPDATE file_blobs SET last_served = CURRENT_TIMESTAMP, serve_count = serve_count + 1
+               WHERE cache_key = ?''', (cache_key,))
+
+    async def get_store_usage(self) -> int:
+        """Total bytes held by the download store."""
+        rows = await self.execute_query_with_result('''SELECT COALESCE(SUM(file_size), 0) FROM file_blobs''', ())
+        return rows[0][0]
+
+    async def get_eviction_candidates(self, policy: str, limit: int) -> List[Tuple[Any, ...]]:
+        """
+        (cache_key, blob_path, file_size) in eviction order: blobs no downloaded
+        link points at first, then least recently or least often served.
+        """
+        order = "serve_count ASC, last_served ASC" if policy == 'lfu' else "last_served ASC"
+        # Fresh blobs count as referenced, so one that is about to be linked
+        # is not the first to go.
+        return await self.execute_query_with_result(
+            f'''SELECT cache_key, blob_path, COALESCE(file_size, 0) FROM file_blobs
+                ORDER BY (created_at > datetime('now', '-1 hour') OR EXISTS (
+                              SELECT 1 FROM youtube_links
+                              WHERE youtube_links.cache_key = file_blobs.cache_key
+                              AND youtube_links.status = 'downloaded'
+                          )), {order} LIMIT ?''', (limit,))
+
+    async def get_blob_links(self, cache_key: str) -> List[Tuple[int, str]]:
+        """(id, file_path) of the downloaded user links that point at a blob."""
+        return await self.execute_query_with_result(
+            '''SELECT id, file_path FROM youtube_links
+               WHERE cache_key = ? AND status = 'downloaded' ''', (cache_key,))
+
+    async def get_blob_paths(self) -> List[Tuple[str, str]]:
+        return await self.execute_query_with_result('''SELECT cache_key, blob_path FROM file_blobs''', ())
+
+    async def get_unsized_blobs(self) -> List[Tuple[str, str]]:
+        return await self.execute_query_with_result(
+            '''SELECT cache_key, blob_path FROM file_blobs WHERE file_size IS NULL''', ())
+
+    async def set_blob_sizes(self, sizes: List[Tuple[int, str]]) -> None:
+        """Store (file_size, cache_key) pairs in one transaction."""
+        future = self.write_queue.submit_many(
+            '''UPDATE file_blobs SET file_size = ? WHERE cache_key = ?''', sizes, wait=True)
+        await asyncio.wrap_future(future)
+
+    async def delete_file_blobs(self, cache_keys: List[str]) -> None:
+        """Delete blob rows in a single transaction and wait for the commit."""
+        future = self.write_queue.submit_many(
+            '''DELETE FROM file_blobs WHERE cache_key = ?''', [(key,) for key in cache_keys], wait=True)
+        await asyncio.wrap_future(future)
+
+    async def delete_file_blob(self, cache_key: str) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._delete_file_blob, cache_key)
+
+    def _delete_file_blob(self, cache_key: str) -> None:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''DELETE FROM file_blobs WHERE cache_key = ?''', (cache_key,))
+        conn.commit()
+
+    async def claim_blob_fetch(self, cache_key: str, owner: str, lease_seconds: float) -> bool:
+        """Claim the fetch of a store file for lease_seconds; False if another owner holds it."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._claim_blob_fetch, cache_key, owner, lease_seconds)
+
+    def _claim_blob_fetch(self, cache_key: str, owner: str, lease_seconds: float) -> bool:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        now = time.time()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            # Claims of crashed processes run out instead of blocking forever
+            cursor.execute('''DELETE FROM blob_fetches WHERE expires_at < ?''', (now,))
+            cursor.execute('''INSERT OR IGNORE INTO blob_fetches (cache_key, owner, expires_at)
+                              VALUES (?, ?, ?)''', (cache_key, owner, now + lease_seconds))
+            claimed = cursor.rowcount == 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return claimed
+
+    async def reserve_blob_fetch(self, cache_key: str, owner: str, nbytes: int, limit: int) -> bool:
+        """
+        Reserve nbytes of the store budget on a held fetch claim, if stored
+        blobs plus every running fetch's reservation stay within limit.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._reserve_blob_fetch, cache_key, owner, nbytes, limit)
+
+    def _reserve_blob_fetch(self, cache_key: str, owner: str, nbytes: int, limit: int) -> bool:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('''SELECT (SELECT COALESCE(SUM(file_size), 0) FROM file_blobs)
+                                   + (SELECT COALESCE(SUM(reserved_bytes), 0) FROM blob_fetches
+                                      WHERE expires_at >= ? AND NOT (cache_key = ? AND owner = ?))''',
+                           (time.time(), cache_key, owner))
+            reserved = False
+            if cursor.fetchone()[0] + nbytes <= limit:
+                cursor.execute('''UPDATE blob_fetches SET reserved_bytes = ? WHERE cache_key = ? AND owner = ?''',
+                               (nbytes, cache_key, owner))
+                reserved = cursor.rowcount == 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return reserved
+
+    async def get_reserved_bytes(self) -> int:
+        """Store budget held by the fetches running in any process."""
+        rows = await self.execute_query_with_result(
+            '''SELECT COALESCE(SUM(reserved_bytes), 0) FROM blob_fetches WHERE expires_at >= ?''', (time.time(),))
+        return rows[0][0]
+
+    async def renew_blob_fetch(self, cache_key: str, owner: str, lease_seconds: float) -> None:
+        future = self.write_queue.submit(
+            '''UPDATE blob_fetches SET expires_at = ? WHERE cache_key = ? AND owner = ?''',
+            (time.time() + lease_seconds, cache_key, owner), wait=True)
+        await asyncio.wrap_future(future)
+
+    async def release_blob_fetch(self, cache_key: str, owner: str) -> None:
+        future = self.write_queue.submit(
+            '''DELETE FROM blob_fetches WHERE cache_key = ? AND owner = ?''', (cache_key, owner), wait=True)
+        await asyncio.wrap_future(future)
+
+    # ------------------------- Bulk Job Methods -------------------------
+
+    async def create_bulk_job(self, user_id: int, chat_id: int, kind: str = 'file') -> int:
+        """Create a job for a .txt upload ('file') or a playlist ('playlist')."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._create_bulk_job, user_id, chat_id, kind)
+
+    def _create_bulk_job(self, user_id: int, chat_id: int, kind: str) -> int:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''INSERT INTO bulk_jobs (user_id, chat_id, kind) VALUES (?, ?, ?)''',
+                       (user_id, chat_id, kind))
+        conn.commit()
+        return cursor.lastrowid
+
+    async def add_bulk_job_items(self, items: List[Tuple[int, int, str]]) -> None:
+        """Insert (job_id, position, video_id) rows; videos already in the job are ignored."""
+        future = self.write_queue.submit_many(
+            '''INSERT OR IGNORE INTO bulk_job_items (job_id, position, video_id) VALUES (?, ?, ?)''', items, wait=True)
+        await asyncio.wrap_future(future)
+
+    async def finish_bulk_job_ingest(self, job_id: int, resolved: int) -> int:
+        """Record the job's item count, out of `resolved` links, and mark it ready."""
+        await self.flush()
+        rows = await self.execute_query_with_result(
+            '''SELECT COUNT(*) FROM bulk_job_items WHERE job_id = ?''', (job_id,))
+        total = rows[0][0]
+        future = self.write_queue.submit(
+            '''UPDATE bulk_jobs SET status = 'ready', total = ?, duplicates = ? WHERE id = ?''',
+            (total, resolved - total, job_id), wait=True)
+        await asyncio.wrap_future(future)
+        return total
+
+    async def get_bulk_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        rows = await self.execute_query_with_result(
+            '''SELECT id, user_id, chat_id, status, resolution, total, duplicates, kind
+               FROM bulk_jobs WHERE id = ?''', (job_id,))
+        if not rows:
+            return None
+        keys = ('id', 'user_id', 'chat_id', 'status', 'resolution', 'total', 'duplicates', 'kind')
+        return dict(zip(keys, rows[0]))
+
+    async def get_running_bulk_job_ids(self) -> List[int]:
+        rows = await self.execute_query_with_result('''SELECT id FROM bulk_jobs WHERE status = 'running' ''', ())
+        return [job_id for job_id, in rows]
+
+    async def count_bulk_job_items(self, job_id: int) -> Dict[str, int]:
+        """Number of a job's items per status."""
+        rows = await self.execute_query_with_result(
+            '''SELECT status, COUNT(*) FROM bulk_job_items WHERE job_id = ? GROUP BY status''', (job_id,))
+        return dict(rows)
+
+    async def set_bulk_job_status(self, job_id: int, status: str, resolution: str = None) -> None:
+        future = self.write_queue.submit(
+            '''UPDATE bulk_jobs SET status = ?, resolution = COALESCE(?, resolution) WHERE id = ?''',
+            (status, resolution, job_id), wait=True)
+        await asyncio.wrap_future(future)
+
+    async def claim_bulk_job(self, job_id: int, user_id: int, resolution: str) -> bool:
+        """Move a ready job of this user to running; False if it is not there or already claimed."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._claim_bulk_job, job_id, user_id, resolution)
+
+    def _claim_bulk_job(self, job_id: int, user_id: int, resolution: str) -> bool:
         conn = self._get_connection()
         cursor = conn.cursor()
-        cursor.execute('''INSERT INTO youtube_links (user_id, video_id, title, extension, status, file_path)
-                            VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(video_id) DO UPDATE SET
-                            title=excluded.title, extension=excluded.extension, 
-                            status=excluded.status, file_path=excluded.file_path, 
-                            download_time=excluded.download_time''', 
-                        (user_id, video_id, title, extension, status, file_path))
+        cursor.execute('''UPDATE bulk_jobs SET status = 'running', resolution = ?
+                          WHERE id = ? AND user_id = ? AND status = 'ready' ''',
+                       (resolution, job_id, user_id))
         conn.commit()
+        return cursor.rowcount == 1
+
+    async def get_bulk_job_items(
+        self, job_id: int, after_position: int, limit: int, status: str = None
+    ) -> List[Tuple[int, str, str, str, Optional[int]]]:
+        """One page of (position, video_id, status, file_url, download_job_id) in position order."""
+        return await self.execute_query_with_result(
+            '''SELECT position, video_id, status, file_url, download_job_id FROM bulk_job_items
+               WHERE job_id = ? AND position > ? AND (? IS NULL OR status = ?)
+               ORDER BY position LIMIT ?''', (job_id, after_position, status, status, limit))
+
+    async def update_bulk_job_item(self, job_id: int, position: int, status: str, file_url: str = None) -> None:
+        """Checkpoint an item's outcome; returns once it is committed."""
+        future = self.write_queue.submit(
+            '''UPDATE bulk_job_items SET status = ?, file_url = ? WHERE job_id = ? AND position = ?''',
+            (status, file_url, job_id, position), wait=True)
+        await asyncio.wrap_future(future)
 
-    async def update_link_status(self, user_id: int, video_id: str, status: str) -> None:
+    async def set_bulk_item_download_job(self, job_id: int, position: int, download_job_id: int) -> None:
+        """Remember the queued download of an item, so a resumed job waits for it instead of queueing another."""
+        future = self.write_queue.submit(
+            '''UPDATE bulk_job_items SET download_job_id = ? WHERE job_id = ? AND position = ?''',
+            (download_job_id, job_id, position), wait=True)
+        await asyncio.wrap_future(future)
+
+    # ------------------------- Download Job Methods -------------------------
+
+    async def enqueue_download_job(self, user_id: int, lane: str, payload: Dict[str, Any]) -> int:
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(self.executor, self._update_link_status, user_id, video_id, status)
+        return await loop.run_in_executor(self.executor, self._enqueue_download_job, user_id, lane, payload)
 
-    def _update_link_status(self, user_id: int, video_id: str, status: str) -> None:
+    def _enqueue_download_job(self, user_id: int, lane: str, payload: Dict[str, Any]) -> int:
         conn = self._get_connection()
         cursor = conn.cursor()
-        cursor.execute('''UPDATE youtube_links SET status = ? WHERE user_id = ? AND video_id = ?''', 
-                        (status, user_id, video_id))
+        cursor.execute('''INSERT INTO download_jobs (user_id, lane, payload, created_at) VALUES (?, ?, ?, ?)''',
+                       (user_id, lane, json.dumps(payload), time.time()))
         conn.commit()
+        return cursor.lastrowid
+
+    async def lease_download_job(
+        self, worker_id: str, lanes: Tuple[str, ...], lease_seconds: float, max_per_user: int
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Lease the next queued job in one of lanes, or return None.
+
+        Interactive jobs go first; within a lane, users with fewer jobs
+        running are served first, and nobody gets more than max_per_user.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._lease_download_job, worker_id, lanes,
+                                          lease_seconds, max_per_user)
+
+    def _lease_download_job(
+        self, worker_id: str, lanes: Tuple[str, ...], lease_seconds: float, max_per_user: int
+    ) -> Optional[Dict[str, Any]]:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        lane_marks = ', '.join('?' for _ in lanes)
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute(f'''SELECT id, user_id, lane, payload, attempts FROM (
+                                   SELECT j.*, (SELECT COUNT(*) FROM download_jobs AS r
+                                                WHERE r.status = 'leased' AND r.lane = j.lane
+                                                AND r.user_id = j.user_id) AS running
+                                   FROM download_jobs AS j
+                                   WHERE j.status = 'queued' AND j.lane IN ({lane_marks}))
+                               WHERE running < ?
+                               ORDER BY lane != 'interactive', running, id LIMIT 1''',
+                           (*lanes, max_per_user))
+            row = cursor.fetchone()
+            if row is None:
+                conn.commit()
+                return None
+            job_id, user_id, lane, payload, attempts = row
+            cursor.execute('''UPDATE download_jobs SET status = 'leased', worker_id = ?,
+                              lease_expires_at = ?, attempts = attempts + 1 WHERE id = ?''',
+                           (worker_id, time.time() + lease_seconds, job_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return {'id': job_id, 'user_id': user_id, 'lane': lane, 'payload': json.loads(payload),
+                'attempts': attempts + 1}
+
+    async def heartbeat_download_job(self, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+        """Extend a lease; False if this worker no longer holds it."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._heartbeat_download_job, job_id, worker_id,
+                                          lease_seconds)
+
+    def _heartbeat_download_job(self, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''UPDATE download_jobs SET lease_expires_at = ?
+                          WHERE id = ? AND worker_id = ? AND status = 'leased' ''',
+                       (time.time() + lease_seconds, job_id, worker_id))
+        conn.commit()
+        return cursor.rowcount == 1
+
+    async def finish_download_job(
+        self, job_id: int, worker_id: str, status: str, result: Dict[str, Any] = None, error: str = None
+    ) -> bool:
+        """
+        Record a job outcome: 'done' or 'failed', or 'queued' to give it back
+        for another attempt. False if the lease had already been lost.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._finish_download_job, job_id, worker_id,
+                                          status, result, error)
+
+    def _finish_download_job(
+        self, job_id: int, worker_id: str, status: str, result: Dict[str, Any], error: str
+    ) -> bool:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        finished_at = None if status == 'queued' else time.time()
+        cursor.execute('''UPDATE download_jobs SET status = ?, result = ?, error = ?, finished_at = ?,
+                          worker_id = NULL, lease_expires_at = NULL
+                          WHERE id = ? AND worker_id = ? AND status = 'leased' ''',
+                       (status, json.dumps(result) if result is not None else None, error, finished_at,
+                        job_id, worker_id))
+        conn.commit()
+        return cursor.rowcount == 1
+
+    async def requeue_expired_download_jobs(self, max_attempts: int) -> Tuple[int, int]:
+        """Give expired leases back to the queue; returns (requeued, failed for good)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._requeue_expired_download_jobs, max_attempts)
+
+    def _requeue_expired_download_jobs(self, max_attempts: int) -> Tuple[int, int]:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        now = time.time()
+        cursor.execute('''UPDATE download_jobs SET status = 'failed', error = 'lease expired',
+                          finished_at = ?, worker_id = NULL
+                          WHERE status = 'leased' AND lease_expires_at < ? AND attempts >= ?''',
+                       (now, now, max_attempts))
+        failed = cursor.rowcount
+        cursor.execute('''UPDATE download_jobs SET status = 'queued', worker_id = NULL, lease_expires_at = NULL
+                          WHERE status = 'leased' AND lease_expires_at < ?''', (now,))
+        requeued = cursor.rowcount
+        conn.commit()
+        return requeued, failed
+
+    def set_download_job_progress(self, job_id: int, worker_id: str, progress: Dict[str, Any]) -> None:
+        """Record a leased job's progress; write-behind, as only the latest value matters."""
+        self.write_queue.submit(
+            '''UPDATE download_jobs SET progress = ? WHERE id = ? AND worker_id = ? AND status = 'leased' ''',
+            (json.dumps(progress), job_id, worker_id))
+
+    async def get_download_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        rows = await self.execute_query_with_result(
+            '''SELECT status, result, error, progress FROM download_jobs WHERE id = ?''', (job_id,))
+        if not rows:
+            return None
+        status, result, error, progress = rows[0]
+        return {
+            'status': status,
+            'result': json.loads(result) if result else None,
+            'error': error,
+            'progress': json.loads(progress) if progress else None,
+        }
+
+    async def cancel_download_job(self, job_id: int) -> None:
+        """Drop a job nobody is waiting for any more, unless a worker already has it."""
+        self.write_queue.submit(
+            '''UPDATE download_jobs SET status = 'cancelled', finished_at = ?
+               WHERE id = ? AND status = 'queued' ''', (time.time(), job_id))
+
+    async def delete_finished_download_jobs(self, older_than: float) -> None:
+        future = self.write_queue.submit(
+            '''DELETE FROM download_jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?''',
+            (time.time() - older_than,), wait=True)
+        await asyncio.wrap_future(future)
+
+    # ------------------------- Video Info Methods -------------------------
+
+    async def get_video_info(self, video_id: str, max_age: float) -> Optional[Dict[str, Any]]:
+        """A stored info dict no older than max_age seconds, or None."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._get_video_info, video_id, time.time() - max_age)
+
+    def _get_video_info(self, video_id: str, stored_after: float) -> Optional[Dict[str, Any]]:
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''SELECT info FROM video_info WHERE video_id = ? AND stored_at > ?''',
+                       (video_id, stored_after))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(zlib.decompress(row[0]))
+        except (zlib.error, ValueError) as e:
+            logger.warning(f"Unreadable stored info for {video_id}: {e}")
+            return None
+
+    async def put_video_info(self, video_id: str, info: Dict[str, Any]) -> None:
+        """Store an info dict; compressed on an executor thread, written behind."""
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(
+            self.executor, lambda: zlib.compress(json.dumps(info, separators=(',', ':')).encode()))
+        self.write_queue.submit(
+            '''INSERT INTO video_info (video_id, info, size, stored_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT(video_id) DO UPDATE SET
+                   info = excluded.info, size = excluded.size, stored_at = excluded.stored_at''',
+            (video_id, data, len(data), time.time()))
+
+    async def prune_video_info(self, max_age: float, max_bytes: int) -> None:
+        """Drop expired info, then the oldest entries until the table fits in max_bytes."""
+        self.write_queue.submit('''DELETE FROM video_info WHERE stored_at < ?''', (time.time() - max_age,))
+        future = self.write_queue.submit(
+            '''DELETE FROM video_info WHERE video_id IN (
+                   SELECT video_id FROM (
+                       SELECT video_id, SUM(size) OVER (ORDER BY stored_at DESC, video_id) AS total
+                       FROM video_info
+                   ) WHERE total > ?
+               )''', (max_bytes,), wait=True)
+        await asyncio.wrap_future(future)
 
     # ------------------------- General Query Methods -------------------------
 
@@ -124,7 +708,6 @@ class BotDB:
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(DISTINCT user_id) FROM users")
         result = cursor.fetchone()[0]
-        conn.close()
         return result
 
     def get_total_videos(self) -> int:
@@ -132,7 +715,6 @@ class BotDB:
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM youtube_links")
         result = cursor.fetchone()[0]
-        conn.close()
         return result
     
     def save_table_to_csv(self, table_name: str, file_name: str) -> None:
@@ -147,7 +729,6 @@ class BotDB:
             writer = csv.writer(f)
             writer.writerow(columns)  # نوشتن نام ستون‌ها در سطر اول
             writer.writerows(rows)
-        conn.close()
         logger.info(f"✅ Data from table {table_name} saved to {file_name}")
 
 
@@ -0,0 +1,171 @@
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple
+import queue
+import sqlite3
+import threading
+import time
+from tools.logger import logger
+
+_STOP = object()
+
+
+class _Write:
+    __slots__ = ("sql", "params", "many", "wait", "future")
+
+    def __init__(self, sql: Optional[str], params: Any, many: bool = False, wait: bool = False) -> None:
+        self.sql = sql
+        self.params = params
+        self.many = many
+        self.wait = wait
+        self.future: Future = Future()
+
+
+class WriteQueue:
+    """
+    Write-behind queue that runs on its own thread and commits pending writes
+    as one transaction once max_batch rows are waiting or max_delay seconds
+    have passed since the first of them arrived.
+
+    Every submit returns a concurrent Future that resolves once the write is
+    durable, so callers that need read-your-writes can wait on it. Callers
+    that wait pass wait=True: a batch holding such a write (or a barrier) is
+    committed as soon as the writes already queued are collected, instead
+    of after max_delay.
+    """
+
+    def __init__(
+        self, connect: Callable[[], sqlite3.Connection],
+        max_batch: int = 200, max_delay: float = 0.05
+    ) -> None:
+        self._connect = connect
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.batches = 0
+        self.rows = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def submit(self, sql: str, params: Tuple[Any, ...] = (), wait: bool = False) -> Future:
+        return self._put(_Write(sql, params, wait=wait))
+
+    def submit_many(self, sql: str, seq_of_params: Iterable[Tuple[Any, ...]], wait: bool = False) -> Future:
+        return self._put(_Write(sql, list(seq_of_params), many=True, wait=wait))
+
+    def barrier(self) -> Future:
+        """Future that resolves once everything submitted before it is committed."""
+        return self._put(_Write(None, None, wait=True))
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        self.barrier().result(timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush pending writes and stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _put(self, write: _Write) -> Future:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("WriteQueue is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="botdb-writer", daemon=True)
+                self._thread.start()
+        self._queue.put(write)
+        return write.future
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch: List[_Write] = [item]
+            waited_on = item.wait
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    if waited_on:
+                        # Someone is waiting: take only what is already queued
+                        item = self._queue.get_nowait()
+                    elif timeout > 0:
+                        item = self._queue.get(timeout=timeout)
+                    else:
+                        break
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                waited_on = waited_on or item.wait
+            self._commit(batch)
+        # Drain whatever was queued before the stop marker.
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                remaining.append(item)
+        if remaining:
+            self._commit(remaining)
+
+    def _commit(self, batch: Sequence[_Write]) -> None:
+        try:
+            conn = self._connect()
+        except Exception as e:
+            # Fail the batch rather than the writer thread, or its futures would never resolve
+            logger.error(f"Could not open the database, failing {len(batch)} writes: {e}")
+            for write in batch:
+                write.future.set_exception(e)
+            return
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for write in batch:
+                self._execute(conn, write)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"Batched write failed, retrying {len(batch)} writes one by one: {e}")
+            self._commit_individually(conn, batch)
+            return
+        self.batches += 1
+        self.rows += len(batch)
+        for write in batch:
+            write.future.set_result(None)
+
+    def _commit_individually(self, conn: sqlite3.Connection, batch: Sequence[_Write]) -> None:
+        for write in batch:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                self._execute(conn, write)
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                write.future.set_exception(e)
+            else:
+                self.rows += 1
+                write.future.set_result(None)
+
+    @staticmethod
+    def _execute(conn: sqlite3.Connection, write: _Write) -> None:
+        if write.sql is None:
+            return
+        if write.many:
+            conn.executemany(write.sql, write.params)
+        else:
+            conn.execute(write.sql, write.params)
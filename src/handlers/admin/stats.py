@@ -5,6 +5,10 @@ from aiogram.filters import Command
 from config import ADMIN_IDS
 from db.database import BotDB
 from aiogram.types import FSInputFile
+from workers.yt_dl import metadata_cache, video_fetch_stats, video_info_stats
+from workers.postprocess import postprocess_pool
+from tools.handle_old_files import sweep_metrics
+from tools.storage import storage
 
 router = Router()
 db = BotDB()
@@ -19,12 +23,46 @@ async def send_stats_to_admin(message: Message):
 
     users_count = db.get_total_users()
     videos_count = db.get_total_videos()
+    cache_stats = metadata_cache.stats()
+    user_cache_stats = db.user_cache_stats()
+    storage_stats = storage.stats()
+    used_gb = await storage.used_bytes(db) / 1024 ** 3
 
     text = (
         f"📊 <b>آمار کلی ربات</b>\n\n"
         f"👥 تعداد کاربران: <b>{users_count}</b>\n"
-        f"🎥 تعداد ویدیوهای دانلود شده: <b>{videos_count}</b>"
+        f"🎥 تعداد ویدیوهای دانلود شده: <b>{videos_count}</b>\n"
+        f"🗂 کش متادیتا: <b>{cache_stats['hits']}</b> hit / <b>{cache_stats['misses']}</b> miss "
+        f"({cache_stats['hit_rate']:.0%})، "
+        f"ذخیره دیتابیس: <b>{video_info_stats['hits']}</b> hit / <b>{video_info_stats['misses']}</b> miss\n"
+        f"👤 کش کاربران: <b>{user_cache_stats['hit_rate']:.0%}</b> hit "
+        f"({user_cache_stats['size']} کاربر)\n"
+        f"💾 فضای ذخیره: <b>{used_gb:.2f}</b> از {storage_stats['high'] / 1024 ** 3:.0f} گیگابایت، "
+        f"<b>{storage_stats['evicted_blobs']}</b> فایل حذف شده، "
+        f"<b>{storage_stats['rejected']}</b> دانلود رد شده"
     )
+    if sweep_metrics:
+        text += (
+            f"\n🧹 آخرین پاکسازی: <b>{sweep_metrics['links_expired']}</b> لینک، "
+            f"<b>{sweep_metrics['files_removed']}</b> فایل، "
+            f"<b>{sweep_metrics['bytes_evicted'] / 1024 ** 2:.0f}</b> مگابایت آزاد شده "
+            f"در {sweep_metrics['duration_s']} ثانیه"
+        )
+    postprocess_stats = postprocess_pool.stats()
+    if postprocess_stats['jobs']:
+        text += (
+            f"\n⚙️ ffmpeg: <b>{postprocess_stats['jobs']}</b> کار، <b>{postprocess_stats['failed']}</b> ناموفق، "
+            f"میانگین انتظار <b>{postprocess_stats['avg_queue_wait']:.1f}</b> / اجرا "
+            f"<b>{postprocess_stats['avg_wall_time']:.1f}</b> / CPU <b>{postprocess_stats['avg_cpu_time']:.1f}</b> ثانیه"
+        )
+    if video_fetch_stats:
+        text += "\n🎬 دانلود ویدیو (dash / progressive / ناموفق):"
+        for resolution, counts in sorted(video_fetch_stats.items(), key=lambda item: int(item[0][:-1])):
+            attempts = sum(counts.values())
+            text += (
+                f"\n   {resolution}: <b>{counts['dash']}</b> / <b>{counts['progressive']}</b> / "
+                f"<b>{counts['failed']}</b> ({(attempts - counts['failed']) / attempts:.0%} موفق)"
+            )
     await message.answer(text, parse_mode="HTML")
 
     users_csv_path = os.path.join(STATS_FOLDER, "users_data.csv")
@@ -3,7 +3,7 @@ from aiogram.filters import Command
 from i18n.i18n import get_translator
 from db.database import BotDB
 from tools.logger import logger
-from keyboard.keys import get_user_keyboard
+from keyboard.keys import get_keyboard
 
 db = BotDB()
 router = Router()
@@ -16,7 +16,7 @@ async def termsofuse(message: types.Message):
     user_id = message.from_user.id
     user_lang = await db.get_user_lang(user_id)
     _ = get_translator(user_lang)
-    keyboard = await get_user_keyboard(user_id)
+    keyboard = get_keyboard(user_lang)
     help_message = f"*{_('To use the YouTube downloader bot, please follow these guidelines:')}\n" \
         f"**{_('Allowed links:')}**\n" \
         f"1. {_('Regular YouTube video links:')}\n" \
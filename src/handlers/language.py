@@ -2,7 +2,7 @@ from aiogram import types, Router
 from aiogram.filters import Command
 from db.database import BotDB
 from tools.logger import logger
-from keyboard.keys import get_user_keyboard
+from keyboard.keys import get_keyboard
 
 db = BotDB()
 
@@ -13,7 +13,7 @@ async def change_language(message: types.Message):
     current_language = await db.get_user_lang(user_id)
     new_language = "fa" if current_language == "en" else "en"
     await db.save_user_config(user_id, new_language)
-    keyboard = await get_user_keyboard(user_id)
+    keyboard = get_keyboard(new_language)
 
     confirmation_message = (
         '✅ زبان ربات به فارسی تغییر کرد!' if new_language == 'fa'
@@ -63,6 +63,7 @@ async def handle_language_callback(callback_query: types.CallbackQuery):
 
     # Save the user's language preference
     await db.save_user_config(user_id, language)
+    _ = get_translator(language)
     sending_link_message = f'{_("Send a YouTube video or playlist link:")} \n\n' \
             f'------------------------\n' \
             f'⚠️ {_("Bot usage guide:")}\n' \
@@ -1,13 +1,44 @@
 import gettext
+import os
+import threading
+from typing import Callable, Dict
 
-def get_translator(lang_code: str):
+LOCALE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+
+# Process-wide registry of loaded catalogs, keyed by language code.
+_translators: Dict[str, Callable[[str], str]] = {}
+_lock = threading.Lock()
+
+
+def _load_translator(lang_code: str) -> Callable[[str], str]:
     try:
         translator = gettext.translation(
             domain="messages",
-            localedir="i18n/locales",
+            localedir=LOCALE_DIR,
             languages=[lang_code],
             fallback=True
         )
         return translator.gettext
     except Exception:
         return lambda x: x  # fallback
+
+
+def preload_translators() -> None:
+    """Load every catalog shipped in LOCALE_DIR. Called once at startup."""
+    for lang_code in os.listdir(LOCALE_DIR):
+        if os.path.isdir(os.path.join(LOCALE_DIR, lang_code)):
+            get_translator(lang_code)
+
+
+def get_translator(lang_code: str):
+    translator = _translators.get(lang_code)
+    if translator is None:
+        # Languages that were not preloaded are loaded on first use.
+        with _lock:
+            translator = _translators.get(lang_code)
+            if translator is None:
+                translator = _translators[lang_code] = _load_translator(lang_code)
+    return translator
+
+
+preload_translators()
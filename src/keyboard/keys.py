@@ -1,29 +1,46 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from pydantic import ConfigDict
 from db.database import BotDB
 from tools.logger import logger
 
 
 db = BotDB()
 
-async def get_user_keyboard(user_id: int) -> ReplyKeyboardMarkup:
-    """Returns the appropriate keyboard based on user login status."""
-    user_lang = await db.get_user_lang(user_id)
-    buttons = []
-    if user_lang == "fa":
-        # Define the buttons in Persian
-        buttons = [
-            [KeyboardButton(text="🌐 تغییر زبان"), KeyboardButton(text="📘 راهنمای ربات")],
-            [KeyboardButton(text="🛒 ربات ایرانی گرام")]
-        ]
-    elif user_lang == "en":
-        # Define the buttons in English
-        buttons = [
-            [KeyboardButton(text="🌐 Change Language"), KeyboardButton(text="📘 Bot Guide")],
-            [KeyboardButton(text="🛒 Iranigram Bot")]
-        ]
-    
-    return ReplyKeyboardMarkup(
+
+class FrozenReplyKeyboardMarkup(ReplyKeyboardMarkup):
+    """A reply keyboard that cannot be modified, so one instance can be shared."""
+    model_config = ConfigDict(frozen=True)
+
+
+def _build_keyboard(buttons) -> ReplyKeyboardMarkup:
+    return FrozenReplyKeyboardMarkup(
         keyboard=buttons,
         resize_keyboard=True,
         is_persistent=True,
     )
+
+
+# Built once at import; every update reuses these instances.
+KEYBOARDS = {
+    # Define the buttons in Persian
+    "fa": _build_keyboard([
+        [KeyboardButton(text="🌐 تغییر زبان"), KeyboardButton(text="📘 راهنمای ربات")],
+        [KeyboardButton(text="🛒 ربات ایرانی گرام")]
+    ]),
+    # Define the buttons in English
+    "en": _build_keyboard([
+        [KeyboardButton(text="🌐 Change Language"), KeyboardButton(text="📘 Bot Guide")],
+        [KeyboardButton(text="🛒 Iranigram Bot")]
+    ]),
+}
+EMPTY_KEYBOARD = _build_keyboard([])
+
+
+def get_keyboard(user_lang: str) -> ReplyKeyboardMarkup:
+    """Returns the prebuilt keyboard for a language."""
+    return KEYBOARDS.get(user_lang, EMPTY_KEYBOARD)
+
+
+async def get_user_keyboard(user_id: int) -> ReplyKeyboardMarkup:
+    """Returns the appropriate keyboard based on user login status."""
+    return get_keyboard(await db.get_user_lang(user_id))
@@ -2,7 +2,8 @@ import logging
 from aiogram.types import Update, Message
 from aiogram.dispatcher.middlewares.base import BaseMiddleware
 from db.database import BotDB
-from keyboard.keys import get_user_keyboard
+from keyboard.keys import get_keyboard
+from tools.request_context import set_context_lang
 from typing import Callable, Awaitable, Dict, Any
 
 db = BotDB()
@@ -16,13 +17,22 @@ class AutoKeyboardMiddleware(BaseMiddleware):
         event: Update, 
         data: Dict[str, Any]
     ) -> Any:
+        source = event.message or event.callback_query
+        if source is None or source.from_user is None:
+            return await handler(event, data)
+
+        # Resolve the language once per update; handlers pick it up from the
+        # request context instead of asking the database again.
+        user_id = source.from_user.id
+        user_lang = await db.get_user_lang(user_id)
+        set_context_lang(user_id, user_lang)
+        data['user_lang'] = user_lang
+
         # Skip if not a message
         if not event.message:
             return await handler(event, data)
 
-        # Get user keyboard
-        user_id = event.message.from_user.id
-        keyboard = await get_user_keyboard(user_id)
+        keyboard = get_keyboard(user_lang)
         
         # Store keyboard in data for handlers to use
         data['reply_markup'] = keyboard
@@ -35,4 +45,4 @@ class AutoKeyboardMiddleware(BaseMiddleware):
             if not result.reply_markup:
                 await result.edit_reply_markup(reply_markup=keyboard)
         
-        return result
\ No newline at end of file
+        return result
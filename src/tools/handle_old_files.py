@@ -1,32 +1,74 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
 import asyncio
-import os
+import time
+from config import LINK_TTL_SECONDS, SWEEP_INTERVAL, SWEEP_PAGE_SIZE, VIDEO_INFO_TTL, VIDEO_INFO_MAX_BYTES
+from tools.logger import logger
+from tools.reconcile import reconcile_downloads
+from tools.storage import storage, unlink_files
 
-async def delete_old_files(db):
-    cutoff_time = datetime.now() - timedelta(hours=1)
-    query = "SELECT user_id, video_id, title, extension, file_path FROM youtube_links WHERE download_time < ? AND status = 'downloaded'"
+# Metrics of the most recent sweep, shown in the admin /stats report.
+sweep_metrics: Dict[str, Any] = {}
 
-    async def get_old_files():
-        return await db.execute_query_with_result(query, (cutoff_time,))
 
-    old_files = await get_old_files()
-    for old_file in old_files:
-        user_id, video_id, title, extension, file_path = old_file
-        try:
-            if file_path is not None:
-                os.remove(file_path)
-                await db.add_or_update_youtube_link(
-                    user_id=user_id, 
-                    video_id=video_id, 
-                    title=title, 
-                    extension=extension, 
-                    status='deleted'
-                    )
-        except FileNotFoundError:
-            continue
+async def delete_old_files(db) -> Dict[str, Any]:
+    """
+    Expire downloaded links older than LINK_TTL_SECONDS, then bring the
+    store back within its budget. Blobs outlive their links: they stay
+    until eviction needs the space, unreferenced ones first, so popular
+    files are not downloaded again after every expiry.
+
+    Work is done in pages of SWEEP_PAGE_SIZE rows: the files of a page are
+    removed on an executor thread, then the page's status changes are
+    committed in one transaction.
+    """
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+    metrics = {'pages': 0, 'links_expired': 0, 'files_removed': 0, 'files_missing': 0,
+               'files_failed': 0}
+
+    # download_time is written by SQLite's CURRENT_TIMESTAMP, i.e. UTC text.
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=LINK_TTL_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+    after = ('', 0)
+    while True:
+        rows = await db.get_expired_links(cutoff, after, SWEEP_PAGE_SIZE)
+        if not rows:
+            break
+        paths = [file_path for _, _, file_path in rows if file_path is not None]
+        removed, missing, failed = await loop.run_in_executor(None, unlink_files, paths)
+        # A link that was already gone is still marked deleted, otherwise the
+        # blob behind it would never count as unreferenced for eviction.
+        await db.mark_links_deleted([link_id for link_id, _, _ in rows])
+        metrics['pages'] += 1
+        metrics['links_expired'] += len(rows)
+        metrics['files_removed'] += removed
+        metrics['files_missing'] += missing
+        metrics['files_failed'] += len(failed)
+        after = (rows[-1][1], rows[-1][0])
+        if len(rows) < SWEEP_PAGE_SIZE:
+            break
+
+    # Finished download jobs are only kept for as long as their links live
+    await db.delete_finished_download_jobs(LINK_TTL_SECONDS)
+    await db.prune_video_info(VIDEO_INFO_TTL, VIDEO_INFO_MAX_BYTES)
+    metrics['bytes_evicted'] = await storage.enforce(db)
+
+    metrics['duration_s'] = round(time.monotonic() - started, 3)
+    metrics['finished_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    sweep_metrics.clear()
+    sweep_metrics.update(metrics)
+    logger.info(f"Sweep finished: {metrics}")
+    return metrics
 
 
 async def run_delete_files_periodically(db):
     while True:
-        await delete_old_files(db)
-        await asyncio.sleep(300)
+        try:
+            await delete_old_files(db)
+        except Exception as e:
+            logger.error(f"Sweep failed: {e}")
+        try:
+            await reconcile_downloads(db)
+        except Exception as e:
+            logger.error(f"Reconciliation failed: {e}")
+        await asyncio.sleep(SWEEP_INTERVAL)
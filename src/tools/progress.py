@@ -0,0 +1,182 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Set
+import asyncio
+import threading
+import time
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from config import PROGRESS_EDIT_INTERVAL
+from tools.logger import logger
+
+# Receives progress dicts from progress_from_hook, on the event loop
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+# Hook statuses arrive many times a second; anything finer is never shown.
+HOOK_INTERVAL = 0.5
+
+
+def progress_from_hook(status: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Turn a yt_dlp progress or postprocessor hook status into a small,
+    JSON-serialisable progress dict; None for statuses worth no update.
+    """
+    if 'postprocessor' in status:
+        return {'stage': 'processing'} if status.get('status') == 'started' else None
+    if status.get('status') != 'downloading':
+        return None
+    total = status.get('total_bytes') or status.get('total_bytes_estimate')
+    downloaded = status.get('downloaded_bytes') or 0
+    return {
+        'stage': 'downloading',
+        'percent': round(downloaded * 100 / total, 1) if total else None,
+        'speed': status.get('speed'),
+        'eta': status.get('eta'),
+    }
+
+
+def throttle(callback: ProgressCallback, interval: float) -> ProgressCallback:
+    """Pass on at most one progress update per interval, always letting a new stage through."""
+    last = {'at': 0.0, 'stage': None}
+
+    def report(progress: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        if progress['stage'] == last['stage'] and now - last['at'] < interval:
+            return
+        last['at'], last['stage'] = now, progress['stage']
+        callback(progress)
+    return report
+
+
+class CombinedHook:
+    """
+    Merges the yt_dlp progress hooks of streams downloaded side by side
+    (DASH video and audio) into single statuses for one hook: bytes and
+    speeds add up, the ETA is that of the slowest stream.
+    """
+
+    def __init__(self, hook: Callable[[Dict[str, Any]], None]) -> None:
+        self.hook = hook
+        self._streams: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def stream(self, name: str) -> Callable[[Dict[str, Any]], None]:
+        def on_status(status: Dict[str, Any]) -> None:
+            if status.get('status') != 'downloading' or 'postprocessor' in status:
+                self.hook(status)
+                return
+            with self._lock:
+                self._streams[name] = status
+                streams = list(self._streams.values())
+            self.hook({
+                'status': 'downloading',
+                'downloaded_bytes': sum(s.get('downloaded_bytes') or 0 for s in streams),
+                'total_bytes': sum(s.get('total_bytes') or s.get('total_bytes_estimate') or 0 for s in streams),
+                'speed': sum(s.get('speed') or 0 for s in streams),
+                'eta': max((s.get('eta') or 0 for s in streams), default=None),
+            })
+        return on_status
+
+
+def format_progress(_, progress: Dict[str, Any]) -> str:
+    if progress['stage'] == 'processing':
+        return f"⚙️ {_('Processing the file...')}"
+    parts = []
+    if progress.get('percent') is not None:
+        filled = int(progress['percent'] // 10)
+        parts.append(f"{'▓' * filled}{'░' * (10 - filled)} {progress['percent']:.0f}%")
+    if progress.get('speed'):
+        parts.append(f"{progress['speed'] / (1024 * 1024):.1f} MB/s")
+    if progress.get('eta') is not None:
+        minutes, seconds = divmod(int(progress['eta']), 60)
+        parts.append(f"⏱ {minutes}:{seconds:02d}")
+    return f"📥 {' · '.join(parts)}" if parts else f"📥 {_('Please wait...')}"
+
+
+@dataclass
+class _ChatState:
+    last_edit: float = 0.0
+    # message_id -> latest text, oldest first
+    pending: Dict[int, str] = field(default_factory=dict)
+    # The message whose edit is being sent, set once the edit is done
+    editing: Optional[int] = None
+    edit_done: Optional[asyncio.Event] = None
+
+
+class ProgressReporter:
+    """
+    Edits status messages with download progress.
+
+    Updates for a chat are coalesced: only the latest text of each message
+    is kept, and the chat gets at most one edit every `interval` seconds,
+    however many downloads are reporting into it.
+    """
+
+    def __init__(self, interval: float = PROGRESS_EDIT_INTERVAL) -> None:
+        self.interval = interval
+        self._chats: Dict[int, _ChatState] = {}
+        # The loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self.edits = 0
+        self.coalesced = 0
+
+    def update(self, bot: Bot, chat_id: int, message_id: int, text: str) -> None:
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = _ChatState()
+            task = asyncio.create_task(self._flush(bot, chat_id, state))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if message_id in state.pending:
+            self.coalesced += 1
+            del state.pending[message_id]
+        state.pending[message_id] = text
+
+    async def finish(self, chat_id: int, message_id: int) -> None:
+        """
+        Drop pending edits of a message that is about to be edited or deleted
+        for good, and wait for an edit of it that is already being sent.
+        """
+        state = self._chats.get(chat_id)
+        if state is None:
+            return
+        state.pending.pop(message_id, None)
+        if state.editing == message_id:
+            await state.edit_done.wait()
+            # A rate-limited edit is put back before it counts as done
+            state.pending.pop(message_id, None)
+
+    async def _flush(self, bot: Bot, chat_id: int, state: _ChatState) -> None:
+        try:
+            while True:
+                delay = state.last_edit + self.interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if not state.pending:
+                    return
+                message_id = next(iter(state.pending))
+                text = state.pending.pop(message_id)
+                state.editing, state.edit_done = message_id, asyncio.Event()
+                retry_after = 0
+                try:
+                    await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+                    self.edits += 1
+                except TelegramRetryAfter as e:
+                    state.pending.setdefault(message_id, text)
+                    retry_after = e.retry_after
+                except Exception as e:
+                    # Usually "message is not modified" or a message deleted meanwhile
+                    logger.debug(f"Progress edit in chat {chat_id} failed: {e}")
+                finally:
+                    state.editing = None
+                    state.edit_done.set()
+                if retry_after:
+                    await asyncio.sleep(retry_after)
+                state.last_edit = time.monotonic()
+        finally:
+            self._chats.pop(chat_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {'chats': len(self._chats), 'edits': self.edits, 'coalesced': self.coalesced}
+
+
+progress_reporter = ProgressReporter()
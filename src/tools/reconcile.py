@@ -0,0 +1,109 @@
+from typing import Any, Dict, List, Set, Tuple
+import asyncio
+import os
+import time
+from config import DOWNLOAD_DIR, STORE_DIR, RECONCILE_DIRS_PER_RUN, RECONCILE_GRACE_SECONDS
+from tools.logger import logger
+from tools.storage import unlink_files
+
+# Name of the store directory inside DOWNLOAD_DIR, visited like a user directory
+STORE_ENTRY = os.path.basename(os.path.normpath(STORE_DIR))
+
+# Directory the next pass starts after; the walk resumes where it left off.
+_cursor = ''
+
+
+def _list_entries() -> List[str]:
+    try:
+        with os.scandir(DOWNLOAD_DIR) as it:
+            names = {entry.name for entry in it if entry.is_dir(follow_symlinks=False)}
+    except FileNotFoundError:
+        names = set()
+    # STORE_DIR may be configured outside DOWNLOAD_DIR
+    if os.path.isdir(STORE_DIR):
+        names.add(STORE_ENTRY)
+    return sorted(names)
+
+
+def _stray_files(directory: str, known: Set[str], cutoff: float) -> List[str]:
+    """
+    Files in directory that are not in known and whose inode changed before
+    cutoff. ctime rather than mtime, because a fresh hardlink to an old blob
+    keeps the blob's mtime.
+    """
+    stray = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if not entry.is_file(follow_symlinks=False) and not entry.is_symlink():
+                continue
+            if entry.path in known:
+                continue
+            if entry.stat(follow_symlinks=False).st_ctime < cutoff:
+                stray.append(entry.path)
+    return stray
+
+
+def _missing(paths: List[Tuple[Any, str]]) -> List[Any]:
+    return [key for key, path in paths if not path or not os.path.lexists(path)]
+
+
+async def _reconcile_user(db, name: str, cutoff: float) -> Tuple[int, int]:
+    loop = asyncio.get_running_loop()
+    rows = await db.get_user_links(int(name))
+    known = {os.path.join(DOWNLOAD_DIR, name, os.path.basename(path)) for _, path in rows if path}
+    stray = await loop.run_in_executor(None, _stray_files, os.path.join(DOWNLOAD_DIR, name), known, cutoff)
+    removed = (await loop.run_in_executor(None, unlink_files, stray))[0]
+    lost = await loop.run_in_executor(None, _missing, rows)
+    if lost:
+        await db.mark_links_deleted(lost)
+    return removed, len(lost)
+
+
+async def _reconcile_store(db, cutoff: float) -> Tuple[int, int]:
+    loop = asyncio.get_running_loop()
+    rows = await db.get_blob_paths()
+    known = {os.path.join(STORE_DIR, os.path.basename(path)) for _, path in rows}
+    # Young files include downloads that are still running.
+    stray = await loop.run_in_executor(None, _stray_files, STORE_DIR, known, cutoff)
+    removed = (await loop.run_in_executor(None, unlink_files, stray))[0]
+    lost = await loop.run_in_executor(None, _missing, rows)
+    if lost:
+        await db.delete_file_blobs(lost)
+    return removed, len(lost)
+
+
+async def reconcile_downloads(db) -> Dict[str, Any]:
+    """
+    Bring DOWNLOAD_DIR and the database back in line, a few directories at
+    a time: files no row points at are removed once they are older than
+    RECONCILE_GRACE_SECONDS, and rows whose file is gone are retired.
+    """
+    global _cursor
+    loop = asyncio.get_running_loop()
+    metrics = {'dirs': 0, 'stray_removed': 0, 'rows_retired': 0}
+    await db.flush()
+    cutoff = time.time() - RECONCILE_GRACE_SECONDS
+
+    entries = await loop.run_in_executor(None, _list_entries)
+    batch = [name for name in entries if name > _cursor][:RECONCILE_DIRS_PER_RUN]
+    # Wrap around once the end of the listing is reached.
+    _cursor = batch[-1] if len(batch) == RECONCILE_DIRS_PER_RUN else ''
+
+    for name in batch:
+        try:
+            if name == STORE_ENTRY:
+                removed, retired = await _reconcile_store(db, cutoff)
+            elif name.isdigit():
+                removed, retired = await _reconcile_user(db, name, cutoff)
+            else:
+                continue
+        except OSError as e:
+            logger.error(f"Could not reconcile {name}: {e}")
+            continue
+        metrics['dirs'] += 1
+        metrics['stray_removed'] += removed
+        metrics['rows_retired'] += retired
+
+    if metrics['stray_removed'] or metrics['rows_retired']:
+        logger.info(f"Reconciled downloads: {metrics}")
+    return metrics
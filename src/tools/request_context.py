@@ -0,0 +1,20 @@
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+# (user_id, language) of the user whose update is being handled. Set once per
+# update by the keyboard middleware; handlers read it through BotDB.get_user_lang.
+current_user_lang: ContextVar[Optional[Tuple[int, Optional[str]]]] = ContextVar(
+    "current_user_lang", default=None
+)
+
+
+def get_context_lang(user_id: int):
+    """Return (True, language) if the current update belongs to user_id."""
+    value = current_user_lang.get()
+    if value is not None and value[0] == user_id:
+        return True, value[1]
+    return False, None
+
+
+def set_context_lang(user_id: int, language: Optional[str]) -> None:
+    current_user_lang.set((user_id, language))
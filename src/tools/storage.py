@@ -0,0 +1,220 @@
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import os
+import socket
+import time
+import uuid
+from config import (STORAGE_HIGH_WATERMARK, STORAGE_LOW_WATERMARK, STORAGE_EVICTION_POLICY,
+                    STORAGE_ADMIT_TIMEOUT)
+from tools.logger import logger
+
+EVICTION_PAGE_SIZE = 100
+# A fetch claim lasts this long unless renewed, so a crashed process's
+# claim runs out; waiters check this often whether it is free again.
+FETCH_LEASE_SECONDS = 60
+FETCH_POLL_INTERVAL = 1.0
+
+
+class StorageFullError(Exception):
+    """The disk budget could not make room for a download in time."""
+
+
+class FileTooLargeError(Exception):
+    """A download is estimated to be bigger than a single file may be."""
+
+
+def unlink_files(paths: List[str]) -> Tuple[int, int, List[str]]:
+    """Remove files; returns (removed, already missing, paths that could not be removed)."""
+    removed = missing = 0
+    failed = []
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            missing += 1
+        except OSError as e:
+            logger.error(f"Could not remove {path}: {e}")
+            failed.append(path)
+    return removed, missing, failed
+
+
+def _file_sizes(rows: List[Tuple[str, str]]) -> List[Tuple[int, str]]:
+    sizes = []
+    for cache_key, blob_path in rows:
+        try:
+            sizes.append((os.path.getsize(blob_path), cache_key))
+        except OSError:
+            sizes.append((0, cache_key))
+    return sizes
+
+
+class StorageManager:
+    """
+    Byte budget for the download store.
+
+    Usage is the sum of file_blobs.file_size plus the space reserved by
+    downloads that are still running, in any process: reservations are
+    recorded on their blob_fetches claims. A download has to reserve its
+    estimated size first; when that would cross the high watermark, blobs
+    are evicted in policy order down to the low watermark, and if that is
+    still not enough the download waits for running ones to finish.
+    """
+
+    def __init__(self, high: int, low: int, policy: str, admit_timeout: float) -> None:
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.high = high
+        self.low = min(low, high)
+        self.policy = policy
+        self.admit_timeout = admit_timeout
+        # This process's share of the reservations, for /stats
+        self.reserved = 0
+        self._cond: Optional[asyncio.Condition] = None
+        self._evict_lock: Optional[asyncio.Lock] = None
+        self.evicted_blobs = 0
+        self.evicted_bytes = 0
+        self.rejected = 0
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+            self._evict_lock = asyncio.Lock()
+        return self._cond
+
+    async def used_bytes(self, db) -> int:
+        return await db.get_store_usage() + await db.get_reserved_bytes()
+
+    @asynccontextmanager
+    async def reserve(self, db, cache_key: str, nbytes: int) -> AsyncIterator[None]:
+        """
+        Hold nbytes of the budget while cache_key is fetched. The caller must
+        hold its fetch_lock: the reservation is recorded on that claim, so
+        downloads in every process count against the same budget.
+        """
+        if nbytes > self.high:
+            self.rejected += 1
+            raise StorageFullError(f"{nbytes} bytes is more than the whole download store budget")
+        cond = self._condition()
+        deadline = time.monotonic() + self.admit_timeout
+        while not await db.reserve_blob_fetch(cache_key, self.owner, nbytes, self.high):
+            stored = await db.get_store_usage()
+            reserved = await db.get_reserved_bytes()
+            if await self._evict(db, stored + reserved + nbytes - self.low):
+                continue
+            if not reserved:
+                # Nothing is running that could free its reservation.
+                self.rejected += 1
+                raise StorageFullError(f"No room for {nbytes} bytes in the download store")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.rejected += 1
+                raise StorageFullError(f"Timed out waiting for {nbytes} bytes of storage")
+            # Downloads in other processes finish without notifying this one
+            async with cond:
+                try:
+                    await asyncio.wait_for(cond.wait(), min(remaining, FETCH_POLL_INTERVAL))
+                except asyncio.TimeoutError:
+                    pass
+        self.reserved += nbytes
+        try:
+            yield
+        finally:
+            self.reserved -= nbytes
+            async with cond:
+                cond.notify_all()
+
+    @asynccontextmanager
+    async def fetch_lock(self, db, cache_key: str) -> AsyncIterator[None]:
+        """
+        Hold the claim on fetching cache_key into the store, shared by every
+        process using the database. Waits while another process holds it;
+        callers should look for the finished blob again once they get it.
+        """
+        while not await db.claim_blob_fetch(cache_key, self.owner, FETCH_LEASE_SECONDS):
+            await asyncio.sleep(FETCH_POLL_INTERVAL)
+        renewal = asyncio.create_task(self._renew_fetch(db, cache_key))
+        try:
+            yield
+        finally:
+            renewal.cancel()
+            await db.release_blob_fetch(cache_key, self.owner)
+
+    async def _renew_fetch(self, db, cache_key: str) -> None:
+        while True:
+            await asyncio.sleep(FETCH_LEASE_SECONDS / 3)
+            try:
+                await db.renew_blob_fetch(cache_key, self.owner, FETCH_LEASE_SECONDS)
+            except Exception as e:
+                logger.error(f"Could not renew the fetch claim on {cache_key}: {e}")
+
+    async def enforce(self, db) -> int:
+        """Evict down to the low watermark if usage is over the high one."""
+        self._condition()
+        await self.backfill_sizes(db)
+        used = await self.used_bytes(db)
+        if used <= self.high:
+            return 0
+        return await self._evict(db, used - self.low)
+
+    async def backfill_sizes(self, db) -> None:
+        """Record sizes of blobs stored before sizes were tracked."""
+        rows = await db.get_unsized_blobs()
+        if rows:
+            loop = asyncio.get_running_loop()
+            await db.set_blob_sizes(await loop.run_in_executor(None, _file_sizes, rows))
+
+    async def _evict(self, db, nbytes: int) -> int:
+        """Evict blobs, and the user links pointing at them, until nbytes are freed."""
+        loop = asyncio.get_running_loop()
+        freed = 0
+        async with self._evict_lock:
+            while freed < nbytes:
+                rows = await db.get_eviction_candidates(self.policy, EVICTION_PAGE_SIZE)
+                if not rows:
+                    break
+                victims = []
+                selected = 0
+                for cache_key, blob_path, file_size in rows:
+                    victims.append((cache_key, blob_path, file_size))
+                    selected += file_size
+                    if freed + selected >= nbytes:
+                        break
+                link_ids, paths = [], []
+                for cache_key, blob_path, _ in victims:
+                    for link_id, file_path in await db.get_blob_links(cache_key):
+                        link_ids.append(link_id)
+                        if file_path:
+                            paths.append(file_path)
+                    paths.append(blob_path)
+                _, _, failed = await loop.run_in_executor(None, unlink_files, paths)
+                if link_ids:
+                    await db.mark_links_deleted(link_ids)
+                # A blob whose file is still there stays tracked, so its
+                # bytes keep counting and a later pass retries it.
+                failed = set(failed)
+                evicted = [(cache_key, file_size) for cache_key, blob_path, file_size in victims
+                           if blob_path not in failed]
+                if not evicted:
+                    break
+                await db.delete_file_blobs([cache_key for cache_key, _ in evicted])
+                freed += sum(file_size for _, file_size in evicted)
+                self.evicted_blobs += len(evicted)
+                logger.info(f"Evicted {len(evicted)} blobs from the download store")
+        self.evicted_bytes += freed
+        return freed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'high': self.high,
+            'low': self.low,
+            'policy': self.policy,
+            'reserved': self.reserved,
+            'evicted_blobs': self.evicted_blobs,
+            'evicted_bytes': self.evicted_bytes,
+            'rejected': self.rejected,
+        }
+
+
+storage = StorageManager(STORAGE_HIGH_WATERMARK, STORAGE_LOW_WATERMARK, STORAGE_EVICTION_POLICY,
+                         STORAGE_ADMIT_TIMEOUT)
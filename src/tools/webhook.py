@@ -0,0 +1,119 @@
+from typing import Any, Dict
+import asyncio
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import (WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+                    WEBHOOK_MAX_IN_FLIGHT, WEBHOOK_BUSY_TIMEOUT)
+from tools.cache import LRUCache
+from tools.logger import logger
+
+# Seconds shutdown waits for updates that are still being handled
+SHUTDOWN_GRACE = 10
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Webhook handler that acks every update right away and runs the handlers
+    in the background, with at most max_in_flight updates at a time.
+
+    When every slot stays busy for busy_timeout seconds the request gets a
+    503, and Telegram delivers the update again later. Update ids that were
+    already accepted are acked without being handled twice.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str = None,
+                 max_in_flight: int = 100, busy_timeout: float = 5, **data: Any) -> None:
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.busy_timeout = busy_timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._seen = LRUCache(maxsize=max(1000, max_in_flight * 10))
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.failed = 0
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        update_id = update.get('update_id')
+        if update_id is not None and self._seen.get(update_id) is not None:
+            self.duplicates += 1
+            return web.json_response({}, dumps=bot.session.json_dumps)
+
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.busy_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return web.json_response({'error': 'busy'}, status=503, dumps=bot.session.json_dumps)
+
+        if update_id is not None:
+            self._seen.set(update_id, True)
+        self.accepted += 1
+        task = asyncio.create_task(self._feed_update(bot, update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            await self._background_feed_update(bot, update)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Error handling update {update.get('update_id')}: {e}")
+        finally:
+            self._slots.release()
+
+    async def close(self) -> None:
+        tasks = list(self._background_feed_update_tasks)
+        if tasks:
+            logger.info(f"Waiting for {len(tasks)} updates still in flight")
+            await asyncio.wait(tasks, timeout=SHUTDOWN_GRACE)
+        await super().close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'accepted': self.accepted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'in_flight': len(self._background_feed_update_tasks),
+        }
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dp, bot,
+        secret_token=WEBHOOK_SECRET,
+        max_in_flight=WEBHOOK_MAX_IN_FLIGHT,
+        busy_timeout=WEBHOOK_BUSY_TIMEOUT,
+    )
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    app['webhook_handler'] = handler
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Serve updates over the webhook until cancelled."""
+    app = build_webhook_app(dp, bot)
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            url=f'{WEBHOOK_URL.rstrip("/")}{WEBHOOK_PATH}',
+            secret_token=WEBHOOK_SECRET,
+            max_connections=min(WEBHOOK_MAX_IN_FLIGHT, 100),
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    else:
+        logger.warning("WEBHOOK_URL is not set; assuming the webhook is registered already")
+
+    # aiogram already logs every update; skip aiohttp's per-request access log
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,53 @@
+"""
+Download worker entry point.
+
+Runs WORKER_PROCESSES processes that take download jobs from the queue the
+bot writes to. Start any number of these next to a bot running with
+EMBEDDED_WORKER=0; they only need the same database and download directory.
+
+    python worker.py [processes]
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+from config import WORKER_PROCESSES
+from tools.logger import logger
+
+
+def run_worker() -> None:
+    # Imported here so each spawned process builds its own pools and connections.
+    from db.database import BotDB
+    from workers.job_queue import DownloadWorker
+
+    db = BotDB()
+    try:
+        asyncio.run(DownloadWorker().run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+
+
+def main() -> None:
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else WORKER_PROCESSES
+    if processes <= 1:
+        run_worker()
+        return
+    # Spawned processes read their share of the post-processing cores from this
+    os.environ.setdefault('POSTPROCESS_PROCESSES', str(processes))
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=run_worker, name=f'download-worker-{index}') for index in range(processes)]
+    for worker in workers:
+        worker.start()
+    logger.info(f"Started {processes} download worker processes")
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == "__main__":
+    main()
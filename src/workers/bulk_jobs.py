@@ -0,0 +1,195 @@
+from aiogram import Bot
+from aiogram.types import FSInputFile
+from typing import Any, Callable, Dict, Iterable
+import asyncio
+import contextvars
+import tempfile
+import os
+from config import PLAYLIST_CONCURRENCY, BULK_BATCH_SIZE
+from db.database import BotDB
+from i18n.i18n import get_translator
+from tools.logger import logger
+from tools.progress import progress_reporter, format_progress
+from workers.job_queue import enqueue_download, wait_for_download, BULK
+from workers.pipeline import ordered_pipeline
+from workers.yt_dl import get_stored_blob, get_video_details, download_video, format_filesize
+
+db = BotDB()
+
+SUCCESS_STICKER = "CAACAgIAAxkBAAEMNSFmVH2EBvyPvxadOMIK7AuPgcIdpgACEQADJHFiGg4fi9EJ5yBPNQQ"
+
+# Bulk jobs running in this process, so a job is never run twice at once.
+_active: Dict[int, asyncio.Task] = {}
+
+
+async def add_job_items(job_id: int, video_ids: Iterable[str], start: int = 0) -> int:
+    """Append video ids to a job in batches; returns the last position used."""
+    position = start
+    batch = []
+    for video_id in video_ids:
+        position += 1
+        batch.append((job_id, position, video_id))
+        if len(batch) >= BULK_BATCH_SIZE:
+            await db.add_bulk_job_items(batch)
+            batch = []
+    if batch:
+        await db.add_bulk_job_items(batch)
+    return position
+
+
+def start_bulk_job(bot: Bot, job_id: int) -> None:
+    """Run a claimed job in the background, unless it is already running here."""
+    if job_id in _active:
+        return
+    # Started in an empty context: the job outlives the update that started
+    # it, and must not keep that update's cached language for hours.
+    task = contextvars.Context().run(asyncio.create_task, run_bulk_job(bot, job_id))
+    _active[job_id] = task
+    task.add_done_callback(lambda _: _active.pop(job_id, None))
+
+
+async def resume_bulk_jobs(bot: Bot) -> None:
+    """Pick up the jobs that were running when the bot last stopped."""
+    for job_id in await db.get_running_bulk_job_ids():
+        logger.info(f"Resuming bulk job {job_id}")
+        start_bulk_job(bot, job_id)
+
+
+async def _download_item(
+    job: Dict[str, Any], item: tuple, show_progress: Callable[[str, Dict[str, Any]], None]
+) -> Dict[str, Any]:
+    position, video_id, _status, _file_url, download_job_id = item
+    user_id, resolution = job['user_id'], job['resolution']
+    video_url = f'https://www.youtube.com/watch?v={video_id}'
+    # Files already in the store are linked right away instead of waiting
+    # for a download slot.
+    if await get_stored_blob(video_id, 'video', resolution):
+        return await download_video(video_url, None, resolution, user_id, 'video')
+
+    # Metadata is fetched outside the download slots, so the next items are
+    # ready to go as soon as a slot frees up.
+    title = (await get_video_details(video_url))['title']
+
+    def on_progress(progress: Dict[str, Any]) -> None:
+        show_progress(title, progress)
+
+    # A download queued before a restart is still in the queue (or already
+    # done); wait for it rather than queueing the same video again.
+    if download_job_id is not None:
+        queued = await db.get_download_job(download_job_id)
+        if queued is not None and queued['status'] in ('queued', 'leased', 'done'):
+            return await wait_for_download(download_job_id, on_progress)
+
+    download_job_id = await enqueue_download(user_id, video_url, None, resolution, 'video', priority=BULK)
+    await db.set_bulk_item_download_job(job['id'], position, download_job_id)
+    return await wait_for_download(download_job_id, on_progress)
+
+
+async def run_bulk_job(bot: Bot, job_id: int) -> None:
+    """
+    Download the pending items of a running bulk job and deliver them.
+
+    Every item's outcome is committed before the next result is delivered,
+    so after a restart the job carries on from its first unfinished item.
+    """
+    job = await db.get_bulk_job(job_id)
+    if job is None or job['status'] != 'running':
+        return
+    user_id, chat_id, resolution, total = job['user_id'], job['chat_id'], job['resolution'], job['total']
+    _ = get_translator(await db.get_user_lang(user_id))
+
+    counts = await db.count_bulk_job_items(job_id)
+    delivered = counts.get('done', 0) + counts.get('failed', 0)
+    if delivered:
+        waiting_text = f"🔄 {_('Resuming your unfinished download.')} ({delivered}/{total})\n{_('Please wait...')}"
+    else:
+        waiting_text = f"{_('Downloading videos with quality')} {resolution} {_('started.')}\n{_('Please wait...')}"
+    waiting_message = await bot.send_message(chat_id, waiting_text)
+
+    # Every download of the job reports into this one message; the reporter
+    # keeps the edits down to one every few seconds.
+    def show_progress(title: str, progress: Dict[str, Any]) -> None:
+        progress_reporter.update(bot, chat_id, waiting_message.message_id,
+                                 f"{waiting_text}\n\n({delivered}/{total}) {title}\n{format_progress(_, progress)}")
+
+    after = 0
+    while True:
+        items = await db.get_bulk_job_items(job_id, after, BULK_BATCH_SIZE, status='pending')
+        if not items:
+            break
+        async for _index, item, download_result, error in ordered_pipeline(
+                items, lambda item: _download_item(job, item, show_progress), PLAYLIST_CONCURRENCY):
+            position, video_id = item[0], item[1]
+            delivered += 1
+            progress = f"({delivered}/{total})"
+            succeeded = error is None and download_result['status'] == 'success'
+            await db.update_bulk_job_item(job_id, position, 'done' if succeeded else 'failed',
+                                          download_result['file_url'] if succeeded else None)
+            try:
+                if succeeded:
+                    file_size = await format_filesize(user_id, download_result['file_size'])
+                    caption = f"📝 {_('Video Title:')} {progress}\n{download_result['title']}\n\n" \
+                              f"🔗 {_('Download Link')} ({file_size} - {resolution}): \n" \
+                              f"{download_result['file_url']}\n\n" \
+                              f"⚠️ {_('This link is valid for 1 hour.')}"
+                    await bot.send_photo(chat_id, download_result['cover_url'], caption=caption)
+                else:
+                    if error is not None:
+                        logger.error(f"Error processing video {video_id} of bulk job {job_id}: {error}")
+                    await bot.send_message(
+                        chat_id,
+                        f"❌ {progress} {_('An error occurred while downloading the video. Please try again.')}\n"
+                        f"https://www.youtube.com/watch?v={video_id}")
+            except Exception as e:
+                logger.error(f"Error sending result for video {video_id}: {e}")
+        after = items[-1][0]
+
+    await db.set_bulk_job_status(job_id, 'finished')
+    await progress_reporter.finish(chat_id, waiting_message.message_id)
+    try:
+        await bot.delete_message(chat_id=chat_id, message_id=waiting_message.message_id)
+    except Exception as e:
+        logger.error(f"Error deleting message: {e}")
+
+    if job['kind'] == 'playlist':
+        await _send_playlist_summary(bot, job, _)
+    else:
+        await _send_links_file(bot, job, _)
+    await bot.send_sticker(chat_id, SUCCESS_STICKER)
+
+
+async def _send_playlist_summary(bot: Bot, job: Dict[str, Any], _) -> None:
+    counts = await db.count_bulk_job_items(job['id'])
+    succeeded, failed = counts.get('done', 0), counts.get('failed', 0)
+    if failed == 0:
+        summary = f"✅ {_('All videos in the playlist have been successfully downloaded.')}"
+    else:
+        summary = f"⚠️ {_('Playlist download finished.')}"
+    summary += f"\n\n📊 {_('Downloaded')}: {succeeded}/{job['total']} - {_('Failed')}: {failed}" \
+        f"\n\n🪧 {_('Please recommend our bot to your friends.')}\n@panda_youtube_bot"
+    await bot.send_message(job['chat_id'], summary)
+
+
+async def _send_links_file(bot: Bot, job: Dict[str, Any], _) -> None:
+    """Send the job's links as a text file for download managers, written page by page."""
+    fd, links_path = tempfile.mkstemp(suffix='.txt')
+    try:
+        written = 0
+        with os.fdopen(fd, 'w') as links_file:
+            after = 0
+            while True:
+                items = await db.get_bulk_job_items(job['id'], after, BULK_BATCH_SIZE, status='done')
+                if not items:
+                    break
+                for item in items:
+                    links_file.write(f"{item[3]}\n")
+                written += len(items)
+                after = items[-1][0]
+        if written:
+            await bot.send_document(
+                job['chat_id'],
+                FSInputFile(links_path, filename='dl_links.txt'),
+                caption=f"✅ {_('All download links are ready for use in download manager software.')}\n\n"
+                        f"{_('Please recommend our bot to your friends.')}\n@panda_youtube_bot")
+    finally:
+        os.remove(links_path)
@@ -1,8 +1,12 @@
+from typing import Any, Dict
 from aiogram import types, Bot, Router
-from workers.yt_dl import get_video_details, download_video, is_valid_youtube_url, format_filesize
+from aiogram.types import InlineKeyboardMarkup
+from workers.yt_dl import get_video_details, is_valid_youtube_url, is_audio_quality, format_filesize
+from workers.job_queue import run_download, INTERACTIVE
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-import os
 from tools.logger import logger
+from config import STORAGE_MAX_FILE_BYTES
+from tools.progress import progress_reporter, format_progress
 from db.database import BotDB
 from i18n.i18n import get_translator
 
@@ -10,6 +14,31 @@ from i18n.i18n import get_translator
 router = Router()
 db = BotDB()
 
+
+async def build_quality_keyboard(
+    user_id: int, video_details: Dict[str, Any], message_id: int
+) -> InlineKeyboardMarkup:
+    """One button per format of get_video_details, with its estimated size."""
+    video_id = video_details['video_id']
+    builder = InlineKeyboardBuilder()
+    builder.max_width = 2
+    for fmt in video_details['formats']:
+        # Formats estimated over the per-file limit are not offered at all
+        if (fmt.get('filesize') or 0) > STORAGE_MAX_FILE_BYTES:
+            continue
+        if fmt["extension"] in ['mp4', 'webm']:
+            button_text = f"🎬 {fmt['resolution']} - {fmt['extension'].upper()}"
+        elif fmt["extension"] in ['mp3', 'm4a', 'opus']:
+            button_text = f"🎵 {fmt['note']} - {fmt['extension'].upper()}"
+        else:
+            continue
+        if fmt.get('filesize'):
+            button_text += f" (~{await format_filesize(user_id, fmt['filesize'])})"
+        callback_data = f"vid__{video_id}__{fmt['format_id']}__{fmt['resolution']}__{user_id}__{message_id}"
+        builder.button(text=button_text, callback_data=callback_data)
+    return builder.as_markup()
+
+
 async def handle_youtube_link(message: types.Message, youtube_url: str) -> None:
     user_id = message.from_user.id
     user_lang = await db.get_user_lang(user_id)
@@ -21,25 +50,17 @@ async def handle_youtube_link(message: types.Message, youtube_url: str) -> None:
         verify_msg = f"✅{_('The link is valid.')} \n\n ⏳ {_('Please wait a few moments for the video details to be displayed.')}" 
         verify_message = await message.answer(verify_msg)
         video_details = await get_video_details(youtube_url)
-        video_id = video_details['video_id']
         title = video_details['title']
 
-        builder = InlineKeyboardBuilder()
-        builder.max_width = 2
         caption_message = f"📝 {_('Video Title')}:\n {title}\n\n{_('Please choose your preferred quality:')}"
         button_selection_message = await message.answer_photo(
             video_details['cover_url'],
             caption = caption_message,
-            reply_markup=builder.as_markup()
+            reply_markup=InlineKeyboardBuilder().as_markup()
             )
 
-        for fmt in video_details['formats']:
-            if fmt["extension"] in ['mp4', 'webm', 'mp3']:
-                button_text = f"🎬 {fmt['resolution']} - {fmt['extension'].upper()}"
-                callback_data = f"vid__{video_id}__{fmt['format_id']}__{fmt['resolution']}__{user_id}__{button_selection_message.message_id}"
-                builder.button(text=button_text, callback_data=callback_data)
-        
-        await button_selection_message.edit_reply_markup(reply_markup=builder.as_markup())
+        reply_markup = await build_quality_keyboard(user_id, video_details, button_selection_message.message_id)
+        await button_selection_message.edit_reply_markup(reply_markup=reply_markup)
 
         await message.bot.delete_message(
         chat_id=message.chat.id,
@@ -66,22 +87,30 @@ async def process_video_callback(callback: types.CallbackQuery):
     title = video_details['title']
     audio_verify_message = f"📥 {_('Download audio file with quality')} {resolution} {_('started')}.\n⏳ {_('Please wait...')}"
     video_verify_message = f"📥 {_('Download video with quality')} {resolution} {_('started')}.\n⏳ {_('Please wait...')}"
-    if resolution in ['128kbps', '320kbps']:
+    if is_audio_quality(resolution):
         file_type: str = 'audio'
-        verify_message = await wait_message.edit_text(audio_verify_message)
+        verify_text = audio_verify_message
     else:
         file_type: str = 'video'
-        verify_message = await wait_message.edit_text(video_verify_message)
+        verify_text = video_verify_message
+    verify_message = await wait_message.edit_text(verify_text)
+    chat_id = callback.message.chat.id
 
-    download_result: dict = await download_video(
-        youtube_url, format_id, resolution, user_id, file_type)
+    def show_progress(progress: dict) -> None:
+        progress_reporter.update(callback.message.bot, chat_id, verify_message.message_id,
+                                 f"{verify_text}\n\n{format_progress(_, progress)}")
+
+    download_result: dict = await run_download(
+        user_id, youtube_url, format_id, resolution, file_type, priority=INTERACTIVE, on_progress=show_progress)
+    # The progress message goes whatever the outcome, once no edit of it is in flight
+    await progress_reporter.finish(chat_id, verify_message.message_id)
+    try:
+        await callback.message.bot.delete_message(chat_id=chat_id, message_id=verify_message.message_id)
+    except Exception as e:
+        logger.error(f"Error deleting message: {e}")
 
     if download_result['status'] == 'success':
-        file_size: str = await format_filesize(user_id, os.path.getsize(download_result['file_path']))
-        await callback.message.bot.delete_message(
-            chat_id=callback.message.chat.id,
-            message_id=verify_message.message_id
-            )
+        file_size: str = await format_filesize(user_id, download_result['file_size'])
         await callback.message.bot.delete_message(
             chat_id=callback.message.chat.id,
             message_id=button_selection_message_id
@@ -94,6 +123,20 @@ async def process_video_callback(callback: types.CallbackQuery):
         await callback.message.answer_sticker(
             "CAACAgIAAxkBAAEMNSFmVH2EBvyPvxadOMIK7AuPgcIdpgACEQADJHFiGg4fi9EJ5yBPNQQ"
             )
+    elif download_result.get('reason') == 'too_large':
+        await callback.message.answer(
+            _("This file is too large to download. Please choose a lower quality.")
+        )
+        await callback.message.answer_sticker(
+            "CAACAgIAAxkBAAEMNZRmVILd3EPlGr5_Kebmlh0RXvCg8AACIAADJHFiGkH36EVv-c3oNQQ"
+            )
+    elif download_result.get('reason') == 'storage_full':
+        await callback.message.answer(
+            _("The server is busy right now. Please try again in a few minutes.")
+        )
+        await callback.message.answer_sticker(
+            "CAACAgIAAxkBAAEMNZRmVILd3EPlGr5_Kebmlh0RXvCg8AACIAADJHFiGkH36EVv-c3oNQQ"
+            )
     else:
         await callback.message.answer(
             _("An error occurred while downloading the file. Please try again.")
@@ -1,8 +1,8 @@
 from aiogram import types, Router
-from workers.yt_dl import get_playlist_videos, download_video, format_filesize
+from workers.yt_dl import get_playlist_videos, extract_video_id
+from workers.bulk_jobs import add_job_items, start_bulk_job
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram import Bot
-import os
 from tools.logger import logger
 from db.database import BotDB
 from i18n.i18n import get_translator
@@ -62,54 +62,21 @@ async def process_playlist_callback(callback: types.CallbackQuery, bot: Bot) ->
     video_urls, _ = await get_playlist_videos(playlist_url)
     user_lang = await db.get_user_lang(user_id)
     _ = get_translator(user_lang)
-    for video_number, video_url in enumerate(video_urls, start=1):
-        message_text = lambda video_number: (
-            f'{_("Downloading videos with quality")} {resolution} {_("started.")}\n{_("Please wait..")}.'
-            if video_number == 1 
-            else _("Downloading the next video..."))
-        try:
-            # Send initial or updated message
-            waiting_message = await callback.message.answer(message_text(video_number))
-            download_result = await download_video(video_url, None, resolution, user_id, 'video')
-            if download_result['status'] == 'success':
-                try:
-                    if video_number == 1:
-                        await callback.message.bot.delete_message(
-                                chat_id=callback.message.chat.id,
-                                message_id=button_selection_message_id
-                            )
-                    await callback.message.bot.delete_message(
-                        chat_id=callback.message.chat.id,
-                        message_id=waiting_message.message_id
-                    )
-                    file_size = await format_filesize(
-                        user_id,
-                        os.path.getsize(download_result['file_path']))
-                    main_caption = f"📝 {_('Video Title:')}\n" \
-                                f"{download_result['title']}\n\n" \
-                                f"🔗 {_('Download Link')} ({file_size} - {resolution}): \n " \
-                                f"{download_result['file_url']}\n\n" \
-                                f"⚠️ {_('This link is valid for 1 hour.')}"
-                    if video_number == len(video_urls):
-                        await callback.message.answer_photo(
-                            download_result['cover_url'],
-                            caption=f"{main_caption}\n\n"
-                                f"✅ {_('All videos in the playlist have been successfully downloaded.')}\n\n" \
-                                f"🪧 {_('Please recommend our bot to your friends.')}\n@panda_youtube_bot",
-                        )
-                        await callback.message.answer_sticker("CAACAgIAAxkBAAEMNSFmVH2EBvyPvxadOMIK7AuPgcIdpgACEQADJHFiGg4fi9EJ5yBPNQQ")
-                    else:
-                        await callback.message.answer_photo(
-                            download_result['cover_url'],
-                            caption=f"{main_caption}"
-                        )
-                except Exceptioan as e:
-                    logger.error(f"Error deleting message or sending photo: {e}")
-            else:
-                await bot.send_message(
-                    callback.message.chat.id, 
-                    f'{_("An error occurred while downloading the video. Please try again.")}'
-                    )
-        except Exception as e:
-            logger.error(f"Error processing video {video_number}: {e}")
-    
+    chat_id = callback.message.chat.id
+
+    # The playlist becomes a bulk job whose items are checkpointed in the
+    # database, so a restart resumes it instead of starting over.
+    job_id = await db.create_bulk_job(int(user_id), chat_id, kind='playlist')
+    resolved = await add_job_items(job_id, (video_id for video_id in map(extract_video_id, video_urls) if video_id))
+    if await db.finish_bulk_job_ingest(job_id, resolved) == 0 \
+            or not await db.claim_bulk_job(job_id, int(user_id), resolution):
+        await callback.message.answer(
+            f'{_("An error occurred while processing the playlist. Please try again.")}'
+        )
+        return
+
+    try:
+        await bot.delete_message(chat_id=chat_id, message_id=button_selection_message_id)
+    except Exception as e:
+        logger.error(f"Error deleting message: {e}")
+    start_bulk_job(bot, job_id)
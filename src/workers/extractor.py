@@ -0,0 +1,133 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+import asyncio
+import multiprocessing
+import yt_dlp
+from config import EXTRACTOR_BACKEND, EXTRACTOR_PROCESSES
+from tools.logger import logger
+from workers.ydl_pool import ydl_pool, METADATA, PLAYLIST_FLAT
+
+# This module is imported by the extraction worker processes, so it must stay
+# free of bot-side imports (database, aiogram, ...). So must the top level of
+# the scripts that start them (main.py, worker.py): 'spawn' re-imports the
+# main script in every worker process.
+
+# Only these keys survive extraction; everything else in the info dict is
+# dropped before it crosses the process boundary.
+FORMAT_KEYS = (
+    'format_id', 'ext', 'vcodec', 'acodec', 'height', 'width', 'fps',
+    'tbr', 'abr', 'vbr', 'filesize', 'filesize_approx', 'format_note',
+)
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+class ExtractionError(Exception):
+    """
+    Extraction failed. Unlike yt_dlp's errors, this survives pickling.
+    `expected` is yt_dlp's flag for failures a retry will not fix, such as
+    a private or removed video.
+    """
+
+    def __init__(self, message: str, expected: bool = False) -> None:
+        super().__init__(message)
+        self.expected = expected
+
+    def __reduce__(self):
+        return type(self), (str(self), self.expected)
+
+
+def compact_video_info(info_dict: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': info_dict.get('id'),
+        'title': info_dict.get('title'),
+        'duration': info_dict.get('duration'),
+        'thumbnails': [
+            {'url': t.get('url', ''), 'height': t.get('height') or 0}
+            for t in info_dict.get('thumbnails') or []
+        ],
+        'formats': [
+            {key: fmt.get(key, 'none' if key in ('vcodec', 'acodec') else None) for key in FORMAT_KEYS}
+            for fmt in info_dict.get('formats') or []
+        ],
+    }
+
+
+def compact_playlist_info(info_dict: Dict[str, Any]) -> Dict[str, Any]:
+    compact = {'id': info_dict.get('id')}
+    if 'entries' in info_dict:
+        compact['entries'] = [{'url': entry.get('url')} for entry in info_dict['entries'] if entry]
+    return compact
+
+
+def _extract_info(profile: str, url: str) -> Dict[str, Any]:
+    try:
+        with ydl_pool.checkout(profile) as ydl:
+            info_dict = ydl.extract_info(url, download=False)
+    except yt_dlp.utils.YoutubeDLError as e:
+        # DownloadError wraps the extractor's own error
+        cause = e.exc_info[1] if isinstance(e, yt_dlp.utils.DownloadError) and e.exc_info else e
+        raise ExtractionError(str(e), getattr(cause, 'expected', False)) from None
+    if info_dict is None:
+        raise ExtractionError(f"Could not extract info for {url}")
+    return info_dict
+
+
+def extract_video_info_sync(video_url: str) -> Dict[str, Any]:
+    return compact_video_info(_extract_info(METADATA, video_url))
+
+
+def extract_playlist_info_sync(playlist_url: str) -> Dict[str, Any]:
+    return compact_playlist_info(_extract_info(PLAYLIST_FLAT, playlist_url))
+
+
+def _warm_worker() -> None:
+    # Load every extractor class and pre-build the metadata instances up
+    # front, so the first real request in this process does not pay for it.
+    with ydl_pool.checkout(METADATA), ydl_pool.checkout(PLAYLIST_FLAT):
+        pass
+
+
+def _ping() -> bool:
+    return True
+
+
+def start_extractor_pool() -> None:
+    """Start and warm the extraction processes when the process backend is enabled."""
+    global _process_pool
+    if EXTRACTOR_BACKEND != 'process' or _process_pool is not None:
+        return
+    _process_pool = ProcessPoolExecutor(
+        max_workers=EXTRACTOR_PROCESSES,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_warm_worker,
+    )
+    # Submitting one task per worker makes the pool spawn all of them now.
+    for _ in range(EXTRACTOR_PROCESSES):
+        _process_pool.submit(_ping)
+    logger.info(f"Started {EXTRACTOR_PROCESSES} extraction worker processes")
+
+
+def shutdown_extractor_pool() -> None:
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+async def _run(func, url: str) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    if EXTRACTOR_BACKEND == 'process':
+        start_extractor_pool()
+        return await loop.run_in_executor(_process_pool, func, url)
+    return await loop.run_in_executor(None, func, url)
+
+
+async def extract_video_info(video_url: str) -> Dict[str, Any]:
+    """Extract compact video info on the configured backend."""
+    return await _run(extract_video_info_sync, video_url)
+
+
+async def extract_playlist_info(playlist_url: str) -> Dict[str, Any]:
+    """Extract a compact, flat playlist on the configured backend."""
+    return await _run(extract_playlist_info_sync, playlist_url)
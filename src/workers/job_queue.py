@@ -0,0 +1,215 @@
+from typing import Any, Dict, Optional
+import asyncio
+import os
+import socket
+import uuid
+from config import (DOWNLOAD_MAX_CONCURRENT, DOWNLOAD_MAX_PER_USER, DOWNLOAD_INTERACTIVE_RESERVED,
+                    JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_INTERVAL)
+from db.database import BotDB
+from tools.logger import logger
+from tools.progress import ProgressCallback, throttle
+from workers.yt_dl import download_video
+
+db = BotDB()
+
+# Lanes, in the order they are served.
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+LANES = (INTERACTIVE, BULK)
+
+MAX_POLL_INTERVAL = 2.0
+# Failure reasons of download_video that are final: no retry
+FINAL_REASONS = ('storage_full', 'too_large', 'invalid_quality', 'unavailable')
+# Seconds between progress writes to a job row
+PROGRESS_WRITE_INTERVAL = 1.0
+
+# Jobs enqueued by this process, resolved directly by an embedded worker so
+# the caller does not have to wait for its next poll.
+_waiters: Dict[int, asyncio.Future] = {}
+# Progress callbacks of those waiters; remote workers report through the job row.
+_progress_listeners: Dict[int, ProgressCallback] = {}
+_job_available: Optional[asyncio.Event] = None
+
+
+def _wake_workers() -> None:
+    if _job_available is not None:
+        _job_available.set()
+
+
+async def enqueue_download(
+    user_id: int, video_url: str, format_id: Optional[str], resolution: str, type: str,
+    priority: str = INTERACTIVE
+) -> int:
+    """Queue a download and return its job id."""
+    payload = {'video_url': video_url, 'format_id': format_id, 'resolution': resolution, 'type': type}
+    job_id = await db.enqueue_download_job(int(user_id), priority, payload)
+    _wake_workers()
+    return job_id
+
+
+async def run_download(
+    user_id: int, video_url: str, format_id: Optional[str], resolution: str, type: str,
+    priority: str = INTERACTIVE, on_progress: Optional[ProgressCallback] = None
+) -> Dict[str, Any]:
+    """Queue a download and return download_video's result once a worker has run it."""
+    job_id = await enqueue_download(user_id, video_url, format_id, resolution, type, priority)
+    return await wait_for_download(job_id, on_progress)
+
+
+async def wait_for_download(job_id: int, on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """
+    Wait for a queued download, which may have been queued before a restart.
+    on_progress receives the download's progress while a worker runs it.
+    """
+    waiter = _waiters[job_id] = asyncio.get_running_loop().create_future()
+    if on_progress is not None:
+        _progress_listeners[job_id] = on_progress
+    last_progress = None
+    interval = JOB_POLL_INTERVAL
+    try:
+        while True:
+            try:
+                return await asyncio.wait_for(asyncio.shield(waiter), interval)
+            except asyncio.TimeoutError:
+                pass
+            # Remote workers only report through the database.
+            job = await db.get_download_job(job_id)
+            if job is None:
+                return {'status': 'failed'}
+            if job['status'] in ('done', 'failed', 'cancelled'):
+                return job['result'] or {'status': 'failed'}
+            if on_progress is not None and job['progress'] and job['progress'] != last_progress:
+                last_progress = job['progress']
+                on_progress(last_progress)
+            interval = min(interval * 1.5, MAX_POLL_INTERVAL)
+    except asyncio.CancelledError:
+        await db.cancel_download_job(job_id)
+        raise
+    finally:
+        _waiters.pop(job_id, None)
+        _progress_listeners.pop(job_id, None)
+
+
+class DownloadWorker:
+    """
+    Leases download jobs from the queue and runs up to `concurrency` of them.
+
+    The first `reserved_interactive` slots only take interactive jobs, so a
+    single-video request never waits behind a playlist. Leases are renewed
+    while a job runs, and every worker also hands expired leases of crashed
+    workers back to the queue.
+    """
+
+    def __init__(self, concurrency: int = DOWNLOAD_MAX_CONCURRENT,
+                 reserved_interactive: int = DOWNLOAD_INTERACTIVE_RESERVED) -> None:
+        self.concurrency = max(1, concurrency)
+        self.reserved_interactive = min(reserved_interactive, self.concurrency - 1)
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.completed = 0
+        self.failed = 0
+
+    async def run(self) -> None:
+        global _job_available
+        _job_available = asyncio.Event()
+        logger.info(f"Download worker {self.worker_id} started with {self.concurrency} slots")
+        await asyncio.gather(
+            self._requeue_expired(),
+            *(self._slot(INTERACTIVE,) if index < self.reserved_interactive else self._slot(*LANES)
+              for index in range(self.concurrency)),
+        )
+
+    async def _slot(self, *lanes: str) -> None:
+        while True:
+            try:
+                job = await db.lease_download_job(self.worker_id, lanes, JOB_LEASE_SECONDS, DOWNLOAD_MAX_PER_USER)
+            except Exception as e:
+                logger.error(f"Could not lease a download job: {e}")
+                job = None
+            if job is None:
+                _job_available.clear()
+                try:
+                    await asyncio.wait_for(_job_available.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run_job(job)
+
+    async def _run_job(self, job: Dict[str, Any]) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat(job['id']))
+        try:
+            result = await download_video(user_id=job['user_id'], progress_callback=self._progress_reporter(job['id']),
+                                          **job['payload'])
+        except Exception as e:
+            logger.error(f"Download job {job['id']} failed on attempt {job['attempts']}: {e}")
+            await self._retry_or_fail(job, {'status': 'failed'}, str(e))
+            return
+        finally:
+            heartbeat.cancel()
+
+        if result.get('status') != 'success':
+            if result.get('reason') in FINAL_REASONS:
+                # A deliberate rejection; trying again would only repeat it.
+                await self._finish(job, 'failed', result)
+            else:
+                logger.error(f"Download job {job['id']} failed on attempt {job['attempts']}")
+                await self._retry_or_fail(job, result, 'download failed')
+            return
+        await self._finish(job, 'done', result)
+
+    async def _retry_or_fail(self, job: Dict[str, Any], result: Dict[str, Any], error: str) -> None:
+        if job['attempts'] < JOB_MAX_ATTEMPTS:
+            await db.finish_download_job(job['id'], self.worker_id, 'queued', error=error)
+        else:
+            await self._finish(job, 'failed', result, error)
+
+    async def _finish(self, job: Dict[str, Any], status: str, result: Dict[str, Any], error: str = None) -> None:
+        if not await db.finish_download_job(job['id'], self.worker_id, status, result=result, error=error):
+            logger.warning(f"Download job {job['id']} finished after its lease was lost")
+            return
+        if status == 'done':
+            self.completed += 1
+        else:
+            self.failed += 1
+        self._resolve(job['id'], result)
+
+    def _progress_reporter(self, job_id: int) -> ProgressCallback:
+        # Listeners in this process get every update; database writes are spaced out.
+        write = throttle(lambda progress: db.set_download_job_progress(job_id, self.worker_id, progress),
+                         PROGRESS_WRITE_INTERVAL)
+
+        def report(progress: Dict[str, Any]) -> None:
+            listener = _progress_listeners.get(job_id)
+            if listener is not None:
+                listener(progress)
+            else:
+                write(progress)
+        return report
+
+    def _resolve(self, job_id: int, result: Dict[str, Any]) -> None:
+        waiter = _waiters.get(job_id)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(result)
+
+    async def _heartbeat(self, job_id: int) -> None:
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                if not await db.heartbeat_download_job(job_id, self.worker_id, JOB_LEASE_SECONDS):
+                    logger.warning(f"Lost the lease on download job {job_id}")
+                    return
+            except Exception as e:
+                logger.error(f"Heartbeat for download job {job_id} failed: {e}")
+
+    async def _requeue_expired(self) -> None:
+        while True:
+            try:
+                requeued, failed = await db.requeue_expired_download_jobs(JOB_MAX_ATTEMPTS)
+                if requeued or failed:
+                    logger.warning(f"Expired download leases: {requeued} requeued, {failed} failed")
+                    _wake_workers()
+            except Exception as e:
+                logger.error(f"Could not requeue expired download jobs: {e}")
+            await asyncio.sleep(JOB_LEASE_SECONDS / 2)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'worker_id': self.worker_id, 'completed': self.completed, 'failed': self.failed}
@@ -0,0 +1,47 @@
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Optional, Tuple
+import asyncio
+
+
+async def ordered_pipeline(
+    items: Iterable[Any],
+    worker: Callable[[Any], Awaitable[Any]],
+    concurrency: int,
+) -> AsyncIterator[Tuple[int, Any, Any, Optional[BaseException]]]:
+    """
+    Run worker over items with up to `concurrency` of them in flight and
+    yield (position, item, result, error) in input order, positions
+    starting at 1.
+
+    A slow item only holds back delivery, not work: up to twice
+    `concurrency` items are started ahead of the one being delivered.
+    """
+    concurrency = max(1, concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    iterator = iter(enumerate(items, start=1))
+    pending: deque = deque()
+
+    async def run(item: Any) -> Any:
+        async with semaphore:
+            return await worker(item)
+
+    def start_next() -> None:
+        for position, item in iterator:
+            pending.append((position, item, asyncio.ensure_future(run(item))))
+            return
+
+    for _ in range(concurrency * 2):
+        start_next()
+
+    try:
+        while pending:
+            position, item, task = pending.popleft()
+            try:
+                result, error = await task, None
+            except Exception as e:
+                result, error = None, e
+            start_next()
+            yield position, item, result, error
+    finally:
+        for _, _, task in pending:
+            task.cancel()
@@ -0,0 +1,167 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+from config import POSTPROCESS_CORES, POSTPROCESS_PROCESSES, POSTPROCESS_THREADS, POSTPROCESS_NICE
+from tools.logger import logger
+
+# Seconds a stuck ffmpeg may run before it is killed
+FFMPEG_TIMEOUT = 3600
+# Bytes of ffmpeg's stderr kept for error messages
+STDERR_TAIL = 2000
+
+
+class PostProcessError(Exception):
+    pass
+
+
+def audio_args(source_codec: Optional[str], target: str, bitrate: Optional[str] = None) -> List[str]:
+    """
+    ffmpeg codec arguments that turn an audio stream into `target`
+    ('mp3', 'm4a' or 'opus'). A stream already in the target codec is
+    copied into the new container instead of being encoded again.
+    """
+    codec = (source_codec or '').split('.')[0]
+    if target == 'm4a':
+        if codec in ('mp4a', 'aac'):
+            return ['-acodec', 'copy', '-bsf:a', 'aac_adtstoasc']
+        return ['-acodec', 'aac', '-b:a', bitrate or '160k']
+    if target == 'opus':
+        if codec == 'opus':
+            return ['-acodec', 'copy']
+        return ['-acodec', 'libopus', '-b:a', bitrate or '160k']
+    return ['-acodec', 'libmp3lame', '-b:a', bitrate or '192k']
+
+
+class PostProcessPool:
+    """
+    Runs ffmpeg jobs off the download threads, on a CPU budget.
+
+    `cores` is the budget of the whole machine, split evenly between the
+    `processes` processes that each have a pool. Jobs wait in the pool's
+    own queue and at most its share // threads of them run at once, each
+    limited to `threads` ffmpeg threads and started at niceness `nice`, so
+    encodes can't starve the downloads or the bot.
+    Queue wait, wall time and CPU time (from the child's rusage) are
+    recorded for every job.
+    """
+
+    def __init__(self, cores: int = POSTPROCESS_CORES, processes: int = POSTPROCESS_PROCESSES,
+                 threads: int = POSTPROCESS_THREADS, nice: int = POSTPROCESS_NICE,
+                 history: int = 200) -> None:
+        self.threads = max(1, threads)
+        self.max_jobs = max(1, cores // max(1, processes) // self.threads)
+        self.nice = nice
+        self._executor = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix='ffmpeg')
+        self._pending = 0
+        self.recent = deque(maxlen=history)
+        self.jobs = 0
+        self.failed = 0
+        self.queue_wait = 0.0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+
+    async def run(self, label: str, args: List[str], output_path: str) -> Dict[str, Any]:
+        """
+        Run `ffmpeg <args> <tmp>` and move the result to output_path.
+        Returns the job's metrics; raises PostProcessError if ffmpeg fails.
+        """
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        try:
+            return await loop.run_in_executor(self._executor, self._run, label, args, output_path, time.monotonic())
+        finally:
+            self._pending -= 1
+
+    def _run(self, label: str, args: List[str], output_path: str, queued_at: float) -> Dict[str, Any]:
+        started = time.monotonic()
+        # Same extension, so ffmpeg picks the output container from it
+        working_path = f'{output_path}.part{os.path.splitext(output_path)[1]}'
+        command = ['ffmpeg', '-y', '-nostdin', '-loglevel', 'error', *args,
+                   '-threads', str(self.threads), working_path]
+        if self.nice:
+            # nice(1) execs ffmpeg, so every thread it starts inherits the niceness
+            command = ['nice', '-n', str(self.nice), *command]
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=stderr)
+            try:
+                _, status, usage = self._wait(process)
+            except BaseException:
+                process.kill()
+                process.wait()
+                raise
+            returncode = os.waitstatus_to_exitcode(status)
+            stderr.seek(0)
+            error_output = stderr.read()[-STDERR_TAIL:].decode(errors='replace').strip()
+
+        metrics = {
+            'label': label,
+            'queue_wait': started - queued_at,
+            'wall_time': time.monotonic() - started,
+            'cpu_time': usage.ru_utime + usage.ru_stime,
+            'returncode': returncode,
+        }
+        self._record(metrics)
+        if returncode != 0:
+            if os.path.exists(working_path):
+                os.remove(working_path)
+            raise PostProcessError(f"ffmpeg {label} exited with {returncode}: {error_output}")
+        os.replace(working_path, output_path)
+        logger.info(f"ffmpeg {label}: waited {metrics['queue_wait']:.2f}s, ran {metrics['wall_time']:.2f}s, "
+                    f"CPU {metrics['cpu_time']:.2f}s")
+        return metrics
+
+    @staticmethod
+    def _wait(process: subprocess.Popen) -> tuple:
+        # os.wait4 reaps the child and returns its resource usage, which
+        # Popen.wait() discards.
+        deadline = time.monotonic() + FFMPEG_TIMEOUT
+        while True:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                process.returncode = os.waitstatus_to_exitcode(status)
+                return pid, status, usage
+            if time.monotonic() > deadline:
+                raise PostProcessError(f"ffmpeg timed out after {FFMPEG_TIMEOUT}s")
+            time.sleep(0.05)
+
+    def _record(self, metrics: Dict[str, Any]) -> None:
+        self.recent.append(metrics)
+        self.jobs += 1
+        self.failed += metrics['returncode'] != 0
+        self.queue_wait += metrics['queue_wait']
+        self.wall_time += metrics['wall_time']
+        self.cpu_time += metrics['cpu_time']
+
+    async def merge(self, video_path: str, audio_path: str, output_path: str) -> Dict[str, Any]:
+        """Mux a video-only and an audio-only stream into one MP4, copying both streams."""
+        return await self.run('merge', [
+            '-i', video_path, '-i', audio_path, '-map', '0:v:0', '-map', '1:a:0',
+            '-c', 'copy', '-movflags', '+faststart',
+        ], output_path)
+
+    async def convert_audio(self, source_path: str, source_codec: Optional[str], target: str,
+                            output_path: str, bitrate: Optional[str] = None) -> Dict[str, Any]:
+        args = audio_args(source_codec, target, bitrate)
+        label = f"{'remux' if 'copy' in args else 'encode'} {target}"
+        return await self.run(label, ['-i', source_path, '-vn', *args], output_path)
+
+    def stats(self) -> Dict[str, Any]:
+        jobs = max(self.jobs, 1)
+        return {
+            'max_jobs': self.max_jobs,
+            'threads': self.threads,
+            'pending': self._pending,
+            'jobs': self.jobs,
+            'failed': self.failed,
+            'avg_queue_wait': self.queue_wait / jobs,
+            'avg_wall_time': self.wall_time / jobs,
+            'avg_cpu_time': self.cpu_time / jobs,
+        }
+
+
+postprocess_pool = PostProcessPool()
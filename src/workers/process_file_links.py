@@ -1,149 +1,130 @@
 from workers.yt_dl import (
-    is_valid_youtube_url, 
-    is_youtube_playlist, 
+    is_valid_youtube_url,
     get_playlist_videos,
-    download_video,
-    format_filesize
+    extract_video_id,
+    PLAYLIST_ID_REGEX,
     )
+from workers.bulk_jobs import start_bulk_job
+from workers.pipeline import ordered_pipeline
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.types import FSInputFile
-from aiogram import types, Bot, Router
+from aiogram import types, Router
 from tools.logger import logger
-import shutil
+from typing import Iterator, List
+import tempfile
 import os
-from config import API_TOKEN
+from config import PLAYLIST_CONCURRENCY, BULK_BATCH_SIZE
 from db.database import BotDB
 from i18n.i18n import get_translator
 
-bot = Bot(token=API_TOKEN)
 router = Router()
 db = BotDB()
 
+# Lists that can't be expanded (Watch Later, Liked videos, mixes, history):
+# only the video in the link is downloaded.
+UNEXPANDABLE_LISTS = ('WL', 'LL', 'RD', 'history')
+
+
+def iter_file_lines(path: str) -> Iterator[str]:
+    """Yield the non-empty lines of a text file one at a time."""
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+async def resolve_line(line: str) -> List[str]:
+    """Canonical video ids for one line of a links file: a video, or every video of a playlist."""
+    if not is_valid_youtube_url(line):
+        return []
+    match = PLAYLIST_ID_REGEX.search(line)
+    if match and not match.group(1).startswith(UNEXPANDABLE_LISTS):
+        video_urls, _ = await get_playlist_videos(line)
+        return [video_id for video_id in map(extract_video_id, video_urls) if video_id]
+    video_id = extract_video_id(line)
+    return [video_id] if video_id else []
+
+
+async def ingest_links_file(job_id: int, path: str) -> int:
+    """
+    Stream a links file into bulk_job_items and return the number of links
+    resolved. Playlists are expanded PLAYLIST_CONCURRENCY at a time and
+    items are written in batches, so memory stays bounded whatever the
+    file size; duplicates are dropped by the table's UNIQUE constraint.
+    """
+    resolved = 0
+    batch = []
+    async for _, line, video_ids, error in ordered_pipeline(
+            iter_file_lines(path), resolve_line, PLAYLIST_CONCURRENCY):
+        if error is not None:
+            logger.error(f"Could not resolve {line}: {error}")
+            continue
+        for video_id in video_ids:
+            resolved += 1
+            batch.append((job_id, resolved, video_id))
+        if len(batch) >= BULK_BATCH_SIZE:
+            await db.add_bulk_job_items(batch)
+            batch = []
+    if batch:
+        await db.add_bulk_job_items(batch)
+    return resolved
+
+
 async def handle_file_links(message: types.Message) -> None:
     document = message.document
     user_id = message.from_user.id
     user_lang = await db.get_user_lang(user_id)
     _ = get_translator(user_lang)
     # Check if the file is a text file
-    if document.mime_type == 'text/plain' and document.file_name.endswith('.txt'):
-
-        # Create a directory for the links
-        links_dir = f'../links/{user_id}'
-        os.makedirs(links_dir, exist_ok=True)
-
-        # Download the file
-        file_id = document.file_id
-        file = await bot.get_file(file_id)
-        file_path = file.file_path
-        file_dir = os.path.join(links_dir, document.file_name)
-        await bot.download_file(file_path, file_dir)
-
-        # Count the number of correct links
-        count_currect_links = 0
-
-        # Read the file and check if the links are valid
-        with open(f'{links_dir}/currect_links.txt', 'w+') as new_file:
-            with open(file_dir, 'r') as f:
-                for line in f.readlines():
-                    # Check if the link is a playlist
-                    if 'list=WL' in line or 'list=RD' in line or 'list=history' in line:
-                        line = line.split('&list=')[0]
-                        new_file.write(line + '\n')
-                        count_currect_links += 1
-                    elif is_youtube_playlist(line.strip()):
-                        youtube_links, playlist_id = await get_playlist_videos(line.strip())
-                        for yt_links in youtube_links:
-                            new_file.write(yt_links + '\n')
-                            count_currect_links += 1
-                    # Check if the link is a valid YouTube URL
-                    elif is_valid_youtube_url(line.strip()):
-                        new_file.write(line)
-                        count_currect_links += 1
-            
+    if document.mime_type != 'text/plain' or not document.file_name.endswith('.txt'):
+        await message.reply(_("Please make sure to send a file with a .txt extension."))
+        return
+
+    job_id = await db.create_bulk_job(user_id, message.chat.id)
+    file = await message.bot.get_file(document.file_id)
+    fd, file_dir = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+    try:
+        await message.bot.download_file(file.file_path, file_dir)
+        resolved = await ingest_links_file(job_id, file_dir)
+    finally:
         os.remove(file_dir)
+    count_correct_links = await db.finish_bulk_job_ingest(job_id, resolved)
 
-        resolutions = ["480p", "720p", "1080p"]
-        builder = InlineKeyboardBuilder()
-        message = f"✅ {_('Number of correct links sent:')} {count_currect_links}.\n\n {_('Please choose the download quality for all videos:')}"
-        button_selection_message = await message.answer(message, reply_markup=builder.as_markup())
-        for res in resolutions:
-            callback_data = f'file_{res}_{message.from_user.id}_{button_selection_message.message_id}'
-            builder.button(text=f'🎬 {res} - MP4', callback_data=callback_data[:64])
-
-        builder.adjust(2)
-        await button_selection_message.edit_reply_markup(reply_markup=builder.as_markup())
-    else:
-        await message.reply(_("Please make sure to send a file with a .txt extension."))
+    if count_correct_links == 0:
+        await message.answer(_("No download link was found."))
+        await message.answer(_("Please resend the file with a .txt extension."))
+        return
 
-@router.callback_query(lambda callback_query: callback_query.data.startswith('file_'))
+    text = f"✅ {_('Number of correct links sent:')} {count_correct_links}."
+    if resolved > count_correct_links:
+        text += f"\n{_('Duplicate links skipped:')} {resolved - count_correct_links}"
+    text += f"\n\n {_('Please choose the download quality for all videos:')}"
+
+    resolutions = ["480p", "720p", "1080p"]
+    builder = InlineKeyboardBuilder()
+    for res in resolutions:
+        builder.button(text=f'🎬 {res} - MP4', callback_data=f'file__{job_id}__{res}')
+    builder.adjust(2)
+    await message.answer(text, reply_markup=builder.as_markup())
+
+
+@router.callback_query(lambda callback_query: callback_query.data.startswith('file__'))
 async def process_file_links_callback(callback_query: types.CallbackQuery) -> None:
-    callback_data = callback_query.data
-    data_parts = callback_data.split('_')
-    resolution, user_id, button_selection_message_id = data_parts[1], data_parts[2], int(data_parts[3])
-    user_lang = await get_user_language(user_id)
+    data_parts = callback_query.data.split('__')
+    job_id, resolution = int(data_parts[1]), data_parts[2]
+    user_id = callback_query.from_user.id
+    user_lang = await db.get_user_lang(user_id)
     _ = get_translator(user_lang)
-    # Constructing directory path
-    links_dir = f'links/{user_id}'
 
-    # Checking if the file with correct links exists
-    if not os.path.exists(f'{links_dir}/currect_links.txt'):
+    # Only the first click on a ready job starts it
+    if not await db.claim_bulk_job(job_id, user_id, resolution):
         await callback_query.message.answer(_("No download link was found."))
         await callback_query.message.answer(_("Please resend the file with a .txt extension."))
         return
 
-    # Downloading videos
-    with open(f'{links_dir}/currect_links.txt', 'r') as new_file:
-        if os.path.exists(f'{links_dir}/dl_links.txt'):
-            os.remove(f'{links_dir}/dl_links.txt')
-        for line_number, line in enumerate(new_file, start=1):
-            message_text = lambda video_number: (
-                f"{_('Downloading videos with quality')} {resolution} {_('started.')}\n{_('Please wait...')}."
-            if line_number == 1 
-            else _("Downloading the next video..."))
-            with open(f'{links_dir}/dl_links.txt', 'a+') as download_file:
-                waiting_message = await callback_query.message.answer(message_text(line_number))
-                download_result = await download_video(line, None, resolution, user_id, 'video')
-                if download_result['status'] == 'success':
-                    try:
-                        if line_number == 1:
-                            await callback_query.message.bot.delete_message(
-                                chat_id=callback_query.message.chat.id,
-                                message_id=button_selection_message_id
-                            )
-                        await callback_query.message.bot.delete_message(
-                        chat_id=callback_query.message.chat.id,
-                        message_id=waiting_message.message_id
-                        )
-                        file_size = await format_filesize(user_id, os.path.getsize(download_result['file_path']))
-                        caption_message =  \
-                            f"📝 {_('Video Title:')}\n {download_result['title']}\n\n" \
-                            f"🔗 {_('Download Link')} ({file_size} - {resolution}): \n{download_result['file_url']}\n\n" \
-                            f"⚠️ {_('This link is valid for 1 hour.')}"
-                        await callback_query.message.answer_photo(
-                            download_result['cover_url'],
-                            caption= caption_message,
-                        )
-                        # Sending file size and download link
-                        download_file.write(f"{download_result['file_url']}\n")
-                    except Exception as e:
-                        logger.error(f"Error deleting message or sending photo: {e}")
-                    
-                else:
-                    await bot.send_message(
-                        callback_query.message.chat.id, 
-                        _("An error occurred while downloading the video. Please try again.")
-                        )
-                    _("An error occurred while downloading the video. Please try again.")
-        text_file = FSInputFile(f'{links_dir}/dl_links.txt')
-        await callback_query.message.answer_document(
-            text_file, 
-            caption=f"✅ {_('All download links are ready for use in download manager software.')}\n\n {_('Please recommend our bot to your friends.')}\n@panda_youtube_bot")
-        await callback_query.message.answer_document(
-            text_file,
-            f"✅ {_('All download links are ready for use in download manager software.')}\n\n{_('Please recommend our bot to your friends.')}\n@panda_youtube_bot"
-            )
-        _("All download links are ready for use in download manager software.")
-        _("Please recommend our bot to your friends.")
-        await callback_query.message.answer_sticker("CAACAgIAAxkBAAEMNSFmVH2EBvyPvxadOMIK7AuPgcIdpgACEQADJHFiGg4fi9EJ5yBPNQQ")
-        # Cleaning up
-        shutil.rmtree(links_dir)
+    try:
+        await callback_query.message.delete()
+    except Exception as e:
+        logger.error(f"Error deleting message: {e}")
+    start_bulk_job(callback_query.message.bot, job_id)
@@ -0,0 +1,181 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import os
+import re
+import threading
+import yt_dlp
+from config import STORE_DIR, YDL_POOL_MAX_IDLE
+
+# Option profiles. Download profiles write straight into the shared store
+# under their cache key, so their options never change between calls and a
+# constructed YoutubeDL can be reused as-is. None of them run ffmpeg: that
+# is left to the post-processing pool (workers/postprocess.py).
+METADATA = 'metadata'
+PLAYLIST_FLAT = 'playlist-flat'
+
+PROFILE_REGEX = re.compile(r'^(audio-mp3|video-mp4|dash-video|dash-audio)-(\d+(?:p|kbps))$')
+
+# Audio qualities delivered as YouTube's own stream, only remuxed into a
+# new container instead of re-encoded to MP3: quality -> format selector.
+NATIVE_AUDIO = {
+    'm4a': 'bestaudio[ext=m4a]/bestaudio',
+    'opus': 'bestaudio[acodec=opus]/bestaudio',
+}
+
+
+def audio_profile(resolution: str) -> str:
+    if resolution in NATIVE_AUDIO:
+        return f'audio-{resolution}'
+    return f'audio-mp3-{resolution}'
+
+
+def video_profile(resolution: str) -> str:
+    return f'video-mp4-{resolution}'
+
+
+def dash_profiles(resolution: str) -> tuple:
+    """The (video-only, audio-only) profiles whose streams are merged into one MP4."""
+    return f'dash-video-{resolution}', f'dash-audio-{resolution}'
+
+
+def profile_opts(profile: str) -> Dict[str, Any]:
+    if profile == METADATA:
+        return {
+            'format': 'bestvideo+bestaudio/best',
+            'noplaylist': True,
+        }
+    if profile == PLAYLIST_FLAT:
+        return {
+            'extract_flat': 'in_playlist',  # Flatten the playlist into a list of videos
+            'noplaylist': False,  # Include playlist information
+        }
+
+    if profile.startswith('audio-') and profile[len('audio-'):] in NATIVE_AUDIO:
+        codec = profile[len('audio-'):]
+        # The stream is remuxed into its container by the post-processing pool
+        return {
+            'format': NATIVE_AUDIO[codec],
+            'outtmpl': os.path.join(STORE_DIR, f'%(id)s__audio__{codec}.f%(format_id)s.%(ext)s'),
+            'continuedl': True,
+            'noplaylist': True,
+            'quiet': False,
+        }
+
+    match = PROFILE_REGEX.match(profile)
+    if match is None:
+        raise ValueError(f"Unknown YoutubeDL profile: {profile}")
+    kind, resolution = match.groups()
+
+    if kind == 'audio-mp3':
+        # The stream is encoded to MP3 by the post-processing pool
+        return {
+            'format': 'bestaudio/best',
+            'outtmpl': os.path.join(STORE_DIR, f'%(id)s__audio__{resolution}.f%(format_id)s.%(ext)s'),
+            'continuedl': True,
+            'noplaylist': True,
+            'quiet': False,
+        }
+
+    if kind in ('dash-video', 'dash-audio'):
+        # One stream each, named after its format id next to the final file.
+        # They are merged by the caller, so no postprocessors here.
+        height = int(resolution.replace('p', ''))
+        if kind == 'dash-video':
+            # MP4-friendly codecs first, so a plain stream copy makes a valid MP4
+            selector = f'bestvideo[height={height}][ext=mp4]/bestvideo[height={height}]'
+        else:
+            selector = 'bestaudio[ext=m4a]/bestaudio'
+        return {
+            'format': selector,
+            'outtmpl': os.path.join(STORE_DIR, f'%(id)s__video__{resolution}.f%(format_id)s.%(ext)s'),
+            'continuedl': True,
+            'noplaylist': True,
+            'quiet': False,
+            'downloader': 'aria2c',
+            'downloader_args': {
+                'aria2c': ['-x', '16', '-k', '1M', '-c']
+            }
+        }
+
+    # فقط فرمت‌هایی که شامل audio + video هستند و نیازی به ffmpeg ندارند
+    resolution_int = int(resolution.replace('p', '')) if resolution.endswith('p') else 720
+    return {
+        'format': f'best[ext=mp4][acodec!=none][vcodec!=none][height={resolution_int}]',
+        'outtmpl': os.path.join(STORE_DIR, f'%(id)s__video__{resolution}.%(ext)s'),
+        # The store path is fixed per file, so a download cut off by a
+        # restart picks up its .part file instead of starting again.
+        'continuedl': True,
+        'noplaylist': True,
+        'quiet': False,
+        'downloader': 'aria2c',
+        'downloader_args': {
+            'aria2c': ['-x', '16', '-k', '1M', '-c']
+        }
+    }
+
+
+class YoutubeDLPool:
+    """
+    Pool of pre-constructed YoutubeDL objects, keyed by option profile.
+
+    An instance is only ever used by the thread that checked it out, so
+    the pool is safe to use from executor threads. Instances that raised
+    are dropped rather than returned, in case they were left half-way.
+    """
+
+    def __init__(self, max_idle_per_profile: int) -> None:
+        self.max_idle_per_profile = max_idle_per_profile
+        self._idle: Dict[str, List[yt_dlp.YoutubeDL]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @contextmanager
+    def checkout(
+        self, profile: str, progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Iterator[yt_dlp.YoutubeDL]:
+        """Borrow an instance; its progress and postprocessor hooks go to progress_callback."""
+        with self._lock:
+            idle = self._idle[profile]
+            ydl = idle.pop() if idle else None
+            if ydl is None:
+                self.created += 1
+            else:
+                self.reused += 1
+        if ydl is None:
+            ydl = yt_dlp.YoutubeDL(profile_opts(profile))
+            self._add_progress_hooks(ydl)
+
+        ydl._progress_callback = progress_callback
+        try:
+            yield ydl
+        finally:
+            ydl._progress_callback = None
+
+        with self._lock:
+            idle = self._idle[profile]
+            if len(idle) < self.max_idle_per_profile:
+                idle.append(ydl)
+
+    @staticmethod
+    def _add_progress_hooks(ydl: yt_dlp.YoutubeDL) -> None:
+        # Hooks can't be removed again, so each instance gets one hook that
+        # forwards to whoever has it checked out at the time.
+        def dispatch(status: Dict[str, Any]) -> None:
+            callback = getattr(ydl, '_progress_callback', None)
+            if callback is not None:
+                callback(status)
+        ydl.add_progress_hook(dispatch)
+        ydl.add_postprocessor_hook(dispatch)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'idle': {profile: len(idle) for profile, idle in self._idle.items()},
+            }
+
+
+ydl_pool = YoutubeDLPool(max_idle_per_profile=YDL_POOL_MAX_IDLE)
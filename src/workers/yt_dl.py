@@ -1,18 +1,47 @@
-from typing import Dict, Union, Any
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Union, Any
 from db.database import BotDB
 from slugify import slugify
 import logging
 import asyncio
-import yt_dlp
 import re
 import os
-from dotenv import load_dotenv
-from config import DOWNLOAD_DIR, DOMAIN
+import errno
+import copy
+from config import (DOWNLOAD_DIR, DOMAIN, STORE_DIR, METADATA_CACHE_SIZE, METADATA_CACHE_TTL, VIDEO_INFO_TTL,
+                    STORAGE_DEFAULT_VIDEO_BYTES, STORAGE_DEFAULT_AUDIO_BYTES, STORAGE_MAX_FILE_BYTES,
+                    VIDEO_DOWNLOAD_MODE)
 from i18n.i18n import get_translator
+from tools.cache import AsyncTTLCache, SingleFlight
+from tools.storage import storage, StorageFullError, FileTooLargeError, unlink_files
+from tools.progress import ProgressCallback, CombinedHook, progress_from_hook, throttle, HOOK_INTERVAL
+from workers.extractor import extract_video_info, extract_playlist_info, ExtractionError
+from workers.postprocess import postprocess_pool
+from workers.ydl_pool import ydl_pool, audio_profile, video_profile, dash_profiles, METADATA, NATIVE_AUDIO
 
 
 db = BotDB()
 
+VIDEO_ID_REGEX = re.compile(r'(?:[?&]v=|/shorts/|/embed/|/live/|/v/|youtu\.be/)([0-9A-Za-z_-]{11})')
+
+PLAYLIST_ID_REGEX = re.compile(r'[?&]list=([0-9A-Za-z_-]+)')
+# Qualities end up in store file names, so anything else is rejected
+QUALITY_REGEX = re.compile(r'^(\d{2,4}(p|kbps)|m4a|opus)$')
+
+metadata_cache = AsyncTTLCache(maxsize=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL)
+playlist_cache = AsyncTTLCache(maxsize=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL)
+# Blob downloads currently in progress, keyed by cache key
+inflight_blobs = SingleFlight()
+# link_blob falls back to a symlink on these errors: another filesystem,
+# hardlinks not permitted, or the blob's link count maxed out
+HARDLINK_UNSUPPORTED = (errno.EXDEV, errno.EPERM, errno.EMLINK)
+# Size estimates are rough; reserve a little more than they say
+ESTIMATE_MARGIN = 1.1
+# Video fetches per resolution: how many went 'dash', 'progressive' or 'failed'
+video_fetch_stats: Dict[str, Counter] = defaultdict(Counter)
+# Lookups in the database's info store behind metadata_cache: 'hits' and 'misses'
+video_info_stats: Counter = Counter()
+
 
 def is_valid_youtube_url(video_url: str) -> bool:
     youtube_regex = re.compile(
@@ -33,16 +62,28 @@ def is_youtube_playlist(url: str) -> bool:
 
 
 async def get_video_details(video_url: str) -> Dict[str, Any]:
-    ydl_opts = {
-        'format': 'bestvideo+bestaudio/best',
-        'noplaylist': True,
-    }
-        
-    loop = asyncio.get_event_loop()
-    info_dict = await loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(ydl_opts).extract_info(video_url, download=False))
+    """
+    Return video details, served from the metadata cache when possible.
+    Behind it, info dicts stored in the database spare a re-extraction
+    of recently seen videos after a restart.
+    """
+    video_id = extract_video_id(video_url)
+    return await metadata_cache.get_or_load(video_id or video_url, lambda: _load_video_details(video_url, video_id))
+
+
+async def _load_video_details(video_url: str, video_id: Optional[str]) -> Dict[str, Any]:
+    info_dict = await db.get_video_info(video_id, VIDEO_INFO_TTL) if video_id else None
+    if info_dict is not None:
+        video_info_stats['hits'] += 1
+    else:
+        video_info_stats['misses'] += 1
+        info_dict = await extract_video_info(video_url)
+        if info_dict.get('id'):
+            await db.put_video_info(info_dict['id'], info_dict)
+    return _video_details(info_dict)
+
 
-    with open('info.json', 'a') as f:
-        f.write(str(info_dict))
+def _video_details(info_dict: Dict[str, Any]) -> Dict[str, Any]:
     video_title = info_dict.get('title', 'N/A')
     thumbnails = info_dict.get('thumbnails', [])
 
@@ -58,46 +99,108 @@ async def get_video_details(video_url: str) -> Dict[str, Any]:
         cover_url = highest_quality_thumbnail.get('url', 'N/A')
 
     formats = info_dict.get('formats', [])
-    format_dict = {}
-
-    for fmt in formats:
-        if fmt['vcodec'] != 'none' and fmt['acodec'] == 'none' and fmt.get('height') and fmt['height'] > 360:
-            resolution = f"{fmt['height']}p"
-            if resolution not in format_dict or fmt['format_id'] > format_dict[resolution]['format_id']:
-                format_dict[resolution] = {
-                    'format_id': fmt['format_id'],
-                    'extension': fmt['ext'],
-                    'resolution': resolution,
-                    'note': fmt.get('format_note', 'N/A'),
-                }
-
-    format_list = list(format_dict.values())
-
-    audio_formats = [
-        {'format_id': 'bestaudio_128', 'extension': 'mp3',
-            'resolution': '128kbps', 'note': '128kbps'},
-        {'format_id': 'bestaudio_320', 'extension': 'mp3',
-            'resolution': '320kbps', 'note': '320kbps'},
-    ]
-    format_list.extend(audio_formats)
+    duration = info_dict.get('duration')
+    format_list = build_format_table(formats, duration)
 
     return {
         'title': video_title,
         'cover_url': cover_url,
         'formats': format_list,
+        'duration': duration,
         'video_id': info_dict.get('id', 'N/A')
     }
 
 
+def estimate_size(fmt: Dict[str, Any], duration: Optional[float]) -> Optional[int]:
+    """Bytes a format will take: its reported size, else its bitrate times the duration."""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return None
+
+
+def _bitrate(fmt: Dict[str, Any]) -> float:
+    return fmt.get('tbr') or fmt.get('abr') or fmt.get('vbr') or 0
+
+
+def build_format_table(formats: List[Dict[str, Any]], duration: Optional[float]) -> List[Dict[str, Any]]:
+    """
+    The download options of a video, each with the real format id it is
+    fetched from and its estimated size in bytes ('filesize', None when
+    YouTube gives no hint). Per resolution, the video-only stream the
+    DASH download would take is chosen: MP4 first, then the highest bitrate.
+    """
+    audio_streams = [fmt for fmt in formats if fmt.get('vcodec') == 'none' and fmt.get('acodec') != 'none']
+    # What the dash-audio profile merges in: m4a first, then the highest bitrate
+    merge_audio = max(audio_streams, key=lambda fmt: (fmt.get('ext') == 'm4a', _bitrate(fmt)), default=None)
+    merge_audio_size = estimate_size(merge_audio, duration) if merge_audio else 0
+
+    best_video = {}
+    for fmt in formats:
+        if fmt['vcodec'] != 'none' and fmt['acodec'] == 'none' and fmt.get('height') and fmt['height'] > 360:
+            resolution = f"{fmt['height']}p"
+            current = best_video.get(resolution)
+            if current is None or (fmt['ext'] == 'mp4', _bitrate(fmt)) > (current['ext'] == 'mp4', _bitrate(current)):
+                best_video[resolution] = fmt
+
+    format_list = []
+    for resolution, fmt in sorted(best_video.items(), key=lambda item: item[1]['height']):
+        video_size = estimate_size(fmt, duration)
+        format_list.append({
+            'format_id': fmt['format_id'],
+            'extension': 'mp4',
+            'resolution': resolution,
+            'note': fmt.get('format_note') or 'N/A',
+            'filesize': video_size + merge_audio_size if video_size and merge_audio_size is not None else None,
+        })
+
+    # The stream's own audio where YouTube has it, then MP3 re-encodes
+    for codec in NATIVE_AUDIO:
+        streams = [fmt for fmt in audio_streams if _audio_codec(fmt) == codec]
+        if streams:
+            stream = max(streams, key=_bitrate)
+            format_list.append({'format_id': stream['format_id'], 'extension': codec, 'resolution': codec,
+                                'note': f'{_bitrate(stream):.0f}kbps', 'filesize': estimate_size(stream, duration)})
+    mp3_source = max(audio_streams, key=_bitrate, default=None)
+    for kbps in (128, 320):
+        format_list.append({
+            'format_id': mp3_source['format_id'] if mp3_source else f'bestaudio_{kbps}',
+            'extension': 'mp3',
+            'resolution': f'{kbps}kbps',
+            'note': f'{kbps}kbps',
+            'filesize': int(kbps * 1000 / 8 * duration) if duration else None,
+        })
+    return format_list
+
+
+def _audio_codec(fmt: Dict[str, Any]) -> Optional[str]:
+    """The NATIVE_AUDIO quality a format can be remuxed into, if any."""
+    if (fmt.get('acodec') or '').startswith('opus'):
+        return 'opus'
+    if fmt.get('ext') == 'm4a':
+        return 'm4a'
+    return None
+
+
+def is_audio_quality(resolution: str) -> bool:
+    return resolution.endswith('kbps') or resolution in NATIVE_AUDIO
+
+
+def audio_extension(resolution: str) -> str:
+    return resolution if resolution in NATIVE_AUDIO else 'mp3'
+
+
 async def get_playlist_videos(playlist_url: str) -> tuple:
-    ydl_opts = {
-        'extract_flat': 'in_playlist',  # Flatten the playlist into a list of videos
-        'noplaylist': False,  # Include playlist information
-    }
+    match = PLAYLIST_ID_REGEX.search(playlist_url)
+    cache_key = match.group(1) if match else playlist_url
+    return await playlist_cache.get_or_load(cache_key, lambda: _extract_playlist_videos(playlist_url))
 
-    # Run YoutubeDL in a separate thread to avoid blocking the event loop
-    loop = asyncio.get_event_loop()
-    info_dict = await loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(ydl_opts).extract_info(playlist_url, download=False))
+
+async def _extract_playlist_videos(playlist_url: str) -> tuple:
+    # Runs off the event loop, on a thread or a worker process
+    info_dict = await extract_playlist_info(playlist_url)
 
     # Check if the playlist contains any videos
     if 'entries' not in info_dict:
@@ -112,12 +215,228 @@ async def get_playlist_videos(playlist_url: str) -> tuple:
     return video_urls, playlist_id
 
 
-def delete_existing_files(download_path: str, video_id: str) -> None:
-    for filename in os.listdir(download_path):
-        if video_id in filename:
-            file_path = os.path.join(download_path, filename)
+def extract_video_id(video_url: str) -> Optional[str]:
+    """Return the 11-character YouTube video id from a URL, or None."""
+    match = VIDEO_ID_REGEX.search(video_url)
+    return match.group(1) if match else None
+
+
+def make_cache_key(video_id: str, type: str, resolution: str) -> str:
+    return f'{video_id}__{type}__{resolution}'
+
+
+async def delete_existing_files(user_id: int, video_id: str) -> None:
+    """Remove the files a user already has for a video, as tracked in youtube_links."""
+    rows = await db.get_user_video_links(user_id, video_id)
+    if not rows:
+        return
+    for _, file_path in rows:
+        if file_path:
             logging.info(f"Deleting existing file: {file_path}")
-            os.remove(file_path)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, unlink_files, [file_path for _, file_path in rows if file_path])
+    await db.mark_links_deleted([link_id for link_id, _ in rows])
+
+
+def link_blob(blob_path: str, link_path: str) -> None:
+    """Expose a store blob at link_path, preferring a hardlink over a symlink."""
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    try:
+        os.link(blob_path, link_path)
+    except OSError as e:
+        # Only when hardlinks are impossible here; a blob that disappeared
+        # in the meantime must not turn into a dangling symlink.
+        if e.errno not in HARDLINK_UNSUPPORTED:
+            raise
+        # Relative, so the link also resolves inside the nginx container.
+        os.symlink(os.path.relpath(blob_path, os.path.dirname(link_path)), link_path)
+
+
+async def _fetch_blob(
+    video_url: str, resolution: str, type: str, progress_callback: Optional[ProgressCallback] = None,
+    format_id: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    video_details = await get_video_details(video_url)
+    video_id = video_details['video_id']
+    cache_key = make_cache_key(video_id, type, resolution)
+
+    blob = await db.get_file_blob(cache_key)
+    if blob and os.path.exists(blob['blob_path']):
+        return blob
+
+    estimated_size = _estimated_size(video_details, resolution)
+    if estimated_size is None:
+        estimated_size = STORAGE_DEFAULT_AUDIO_BYTES if type == 'audio' else STORAGE_DEFAULT_VIDEO_BYTES
+    elif estimated_size > STORAGE_MAX_FILE_BYTES:
+        raise FileTooLargeError(f"{cache_key} is estimated at {estimated_size} bytes")
+    else:
+        estimated_size = int(estimated_size * ESTIMATE_MARGIN)
+
+    # Other processes download into the same store paths, so only one of
+    # them may fetch a given file at a time.
+    async with storage.fetch_lock(db, cache_key):
+        blob = await db.get_file_blob(cache_key)
+        if blob and os.path.exists(blob['blob_path']):
+            return blob
+
+        extension = audio_extension(resolution) if type == 'audio' else 'mp4'
+        os.makedirs(STORE_DIR, exist_ok=True)
+        # Must match the outtmpl of the download profile
+        blob_path = os.path.join(STORE_DIR, f'{cache_key}.{extension}')
+
+        logging.info(f"Downloading {cache_key} to {blob_path}")
+
+        on_hook = _progress_hook(progress_callback)
+        # Raises StorageFullError when the disk budget has no room in time
+        async with storage.reserve(db, cache_key, estimated_size):
+            try:
+                if type == 'audio':
+                    await _download_audio(video_url, resolution, blob_path, on_hook, format_id)
+                else:
+                    mode = await _download_video(video_url, resolution, blob_path, on_hook, format_id)
+                    video_fetch_stats[resolution][mode] += 1
+            except Exception as e:
+                logging.error(f"Error downloading video: {e}")
+                if type == 'video':
+                    video_fetch_stats[resolution]['failed'] += 1
+                return None
+
+            if not os.path.exists(blob_path):
+                logging.error(f"File {blob_path} does not exist")
+                return None
+
+            await db.add_file_blob(cache_key, video_id, type, resolution, video_details['title'],
+                                   video_details['cover_url'], extension, blob_path,
+                                   file_size=os.path.getsize(blob_path))
+    return await db.get_file_blob(cache_key)
+
+
+def _progress_hook(progress_callback: Optional[ProgressCallback]) -> Optional[Callable[[Dict[str, Any]], None]]:
+    """A yt_dlp hook passing throttled progress to progress_callback on the event loop, if there is one."""
+    if progress_callback is None:
+        return None
+    loop = asyncio.get_running_loop()
+    report = throttle(lambda progress: loop.call_soon_threadsafe(progress_callback, progress), HOOK_INTERVAL)
+
+    def on_hook(status: Dict[str, Any]) -> None:
+        # Called on the download thread
+        progress = progress_from_hook(status)
+        if progress is not None:
+            report(progress)
+    return on_hook
+
+
+def _estimated_size(video_details: Dict[str, Any], resolution: str) -> Optional[int]:
+    for fmt in video_details.get('formats', []):
+        if fmt['resolution'] == resolution:
+            return fmt.get('filesize')
+    return None
+
+
+def _extract_raw_info(video_url: str) -> Dict[str, Any]:
+    """Extract a video without resolving formats, so each stream download can pick its own."""
+    with ydl_pool.checkout(METADATA) as ydl:
+        return ydl.extract_info(video_url, download=False, process=False)
+
+
+def _download_stream(
+    profile: str, info: Dict[str, Any], on_hook: Optional[Callable], format_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Download the stream a profile selects from an extracted video; returns
+    the chosen format's info, with the downloaded file under 'filepath'.
+    With format_id, only that format is left for the profile to select.
+    """
+    # process_ie_result fills in the info dict it is given
+    info = copy.deepcopy(info)
+    if format_id is not None:
+        chosen = [fmt for fmt in info.get('formats') or [] if fmt.get('format_id') == format_id]
+        if chosen:
+            info['formats'] = chosen
+    with ydl_pool.checkout(profile, on_hook) as ydl:
+        result = ydl.process_ie_result(info, download=True)
+        download = (result.get('requested_downloads') or [result])[0]
+        if not download.get('filepath'):
+            download = dict(download, filepath=ydl.prepare_filename(result))
+        return download
+
+
+async def _download_audio(
+    video_url: str, resolution: str, blob_path: str, on_hook: Optional[Callable], format_id: Optional[str] = None
+) -> None:
+    """Download the audio stream, then remux or encode it into blob_path in the post-processing pool."""
+    loop = asyncio.get_running_loop()
+    info = await loop.run_in_executor(None, _extract_raw_info, video_url)
+    stream = await loop.run_in_executor(None, _download_stream, audio_profile(resolution), info, on_hook, format_id)
+    if on_hook is not None:
+        on_hook({'status': 'started', 'postprocessor': 'ExtractAudio'})
+    bitrate = f"{resolution[:-len('kbps')]}k" if resolution.endswith('kbps') else None
+    await postprocess_pool.convert_audio(stream['filepath'], stream.get('acodec'), audio_extension(resolution),
+                                         blob_path, bitrate)
+    await loop.run_in_executor(None, unlink_files, [stream['filepath']])
+
+
+async def _download_video(
+    video_url: str, resolution: str, blob_path: str, on_hook: Optional[Callable], format_id: Optional[str] = None
+) -> str:
+    """
+    Download a video into blob_path and return the mode used.
+
+    With one extraction, the video-only stream of the requested height and
+    the best audio stream are downloaded side by side and merged without
+    re-encoding ('dash'). Videos without such a stream, or with
+    VIDEO_DOWNLOAD_MODE=progressive, take a format that has both ('progressive').
+    """
+    loop = asyncio.get_running_loop()
+    info = await loop.run_in_executor(None, _extract_raw_info, video_url)
+    height = int(resolution.replace('p', ''))
+    video_only = [fmt for fmt in info.get('formats') or []
+                  if fmt.get('vcodec') != 'none' and fmt.get('acodec') == 'none' and fmt.get('height') == height]
+
+    if VIDEO_DOWNLOAD_MODE != 'dash' or not video_only:
+        await loop.run_in_executor(None, _download_stream, video_profile(resolution), info, on_hook)
+        return 'progressive'
+
+    video_profile_name, audio_profile_name = dash_profiles(resolution)
+    combined = CombinedHook(on_hook) if on_hook is not None else None
+    video_stream, audio_stream = await asyncio.gather(
+        loop.run_in_executor(None, _download_stream, video_profile_name, info,
+                             combined and combined.stream('video'), format_id),
+        loop.run_in_executor(None, _download_stream, audio_profile_name, info,
+                             combined and combined.stream('audio')),
+    )
+    if on_hook is not None:
+        on_hook({'status': 'started', 'postprocessor': 'Merger'})
+    await postprocess_pool.merge(video_stream['filepath'], audio_stream['filepath'], blob_path)
+    # Left in place on failure, so a retry skips streams already fetched
+    await loop.run_in_executor(None, unlink_files, [video_stream['filepath'], audio_stream['filepath']])
+    return 'dash'
+
+
+async def get_stored_blob(video_id: str, type: str, resolution: str) -> Optional[Dict[str, Any]]:
+    """Return the store blob for this file if it is already on disk."""
+    blob = await db.get_file_blob(make_cache_key(video_id, type, resolution))
+    if blob and os.path.exists(blob['blob_path']):
+        return blob
+    return None
+
+
+async def _get_or_fetch_blob(
+    video_url: str, resolution: str, type: str, progress_callback: Optional[ProgressCallback] = None,
+    format_id: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    video_id = extract_video_id(video_url)
+    if video_id:
+        blob = await get_stored_blob(video_id, type, resolution)
+        if blob:
+            return blob
+
+    # Concurrent requests for the same file share a single download; its
+    # progress goes to the request that started it.
+    flight_key = make_cache_key(video_id or video_url, type, resolution)
+    return await inflight_blobs.run(
+        flight_key, lambda: _fetch_blob(video_url, resolution, type, progress_callback, format_id))
 
 
 async def download_video(
@@ -125,168 +444,71 @@ async def download_video(
     format_id: str,
     resolution: str,
     user_id: str,
-    type: str
+    type: str,
+    progress_callback: Optional[ProgressCallback] = None
 ) -> Dict[str, Union[str, bool, Dict[str, str]]]:
-    video_details = await get_video_details(video_url)
-    video_id = video_details['video_id']
-    cover_url = video_details['cover_url']
-    title = slugify(video_details['title'], allow_unicode=True)
+    """
+    Fetch the file into the store if needed and link it for the user.
+    format_id is the format picked from get_video_details' table (None
+    lets the download profile choose). progress_callback, if given,
+    receives download and post-processing progress (see tools.progress)
+    on the event loop.
+    """
+    if not QUALITY_REGEX.match(resolution or ''):
+        logging.error(f"Rejected download with invalid quality {resolution!r}")
+        return {'status': 'failed', 'reason': 'invalid_quality'}
+
+    try:
+        blob = await _get_or_fetch_blob(video_url, resolution, type, progress_callback, format_id)
+    except StorageFullError as e:
+        logging.warning(f"Rejected download of {video_url}: {e}")
+        return {'status': 'failed', 'reason': 'storage_full'}
+    except FileTooLargeError as e:
+        logging.warning(f"Rejected download of {video_url}: {e}")
+        return {'status': 'failed', 'reason': 'too_large'}
+    except ExtractionError as e:
+        if not e.expected:
+            raise
+        logging.warning(f"Rejected download of {video_url}: {e}")
+        return {'status': 'failed', 'reason': 'unavailable'}
+    if blob is None:
+        return {'status': 'failed'}
+
+    video_id = blob['video_id']
+    title = slugify(blob['title'], allow_unicode=True)
+    extension = blob['extension']
 
     download_path = f'{DOWNLOAD_DIR}{user_id}'
     os.makedirs(download_path, exist_ok=True)
 
-    delete_existing_files(download_path, video_id)
-
-    if type == 'audio':
-        extension = 'mp3'
-        file_name = f'{title}_{video_id}.{extension}'
-        full_file_path = os.path.join(download_path, file_name)
-        preferred_quality = '128' if resolution == '128kbps' else '320'
-
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': preferred_quality,
-            }],
-            'outtmpl': (full_file_path[:-4]),
-            'noplaylist': True,
-            'quiet': False,
-        }
-    elif type == 'video':
-        extension = 'mp4'
-        file_name = f'{title}_{video_id}.{extension}'
-        full_file_path = os.path.join(download_path, file_name)
-
-        # فقط فرمت‌هایی که شامل audio + video هستند و نیازی به ffmpeg ندارند
-        resolution_int = int(resolution.replace('p', '')) if resolution.endswith('p') else 720
-        ydl_opts = {
-            'format': f'best[ext=mp4][acodec!=none][vcodec!=none][height={resolution_int}]',
-            'outtmpl': full_file_path,
-            'noplaylist': True,
-            'quiet': False,
-            'downloader': 'aria2c',
-            'downloader_args': {
-                'aria2c': ['-x', '16', '-k', '1M']
-            }
-        }
-
-    logging.info(f"Downloading video to {full_file_path}")
-
-    loop = asyncio.get_event_loop()
-    try:
-        await loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(ydl_opts).download([video_url]))
-    except Exception as e:
-        logging.error(f"Error downloading video: {e}")
-        return {'status': 'failed'}
+    await delete_existing_files(user_id, video_id)
 
-    if not os.path.exists(full_file_path):
-        logging.error(f"File {full_file_path} does not exist")
+    file_name = f'{title}_{video_id}.{extension}'
+    full_file_path = os.path.join(download_path, file_name)
+    try:
+        link_blob(blob['blob_path'], full_file_path)
+    except OSError as e:
+        logging.error(f"Error linking {blob['blob_path']} to {full_file_path}: {e}")
         return {'status': 'failed'}
 
     file_url = f'http://{DOMAIN}/dls/{user_id}/{file_name}'
-    await db.add_or_update_youtube_link(user_id, video_id, video_details['title'], extension, 'downloaded', full_file_path)
+    await db.touch_file_blob(blob['cache_key'])
+    # Committed before returning: delete_existing_files finds a user's files
+    # through this row, even when the next request comes right after.
+    await db.add_or_update_youtube_link(user_id, video_id, blob['title'], extension, 'downloaded',
+                                        full_file_path, cache_key=blob['cache_key'], durable=True)
     return {
         'status': 'success',
         'file_url': file_url,
         'file_name': file_name,
         'video_id': video_id,
-        'cover_url': cover_url,
-        'title': video_details['title'],
-        'file_path': full_file_path
+        'cover_url': blob['cover_url'],
+        'title': blob['title'],
+        'file_path': full_file_path,
+        'file_size': os.path.getsize(full_file_path),
     }
 
 
-# async def download_video(
-#     video_url: str,
-#     format_id: str,
-#     resolution: str,
-#     user_id: str,
-#     type: str
-# ) -> Dict[str, Union[str, bool, Dict[str, str]]]:
-#     video_details = await get_video_details(video_url)
-#     video_id = video_details['video_id']
-#     cover_url = video_details['cover_url']
-#     title = slugify(video_details['title'], allow_unicode=True)
-
-#     download_path = f'{DOWNLOAD_DIR}{user_id}'
-#     os.makedirs(download_path, exist_ok=True)
-
-#     delete_existing_files(download_path, video_id)
-
-#     if type == 'audio':
-#         extension = 'mp3'
-#         file_name = f'{title}_{video_id}.{extension}'
-#         full_file_path = os.path.join(download_path, file_name)
-#         preferred_quality = '128' if resolution == '128kbps' else '320'
-
-#         ydl_opts = {
-#             'format': 'bestaudio/best',
-#             'postprocessors': [{
-#                 'key': 'FFmpegExtractAudio',
-#                 'preferredcodec': 'mp3',
-#                 'preferredquality': preferred_quality,
-#             }],
-#             'outtmpl': (full_file_path[:-4]),
-#             'noplaylist': True,
-#             'quiet': False,
-#         }
-#     elif type == 'video':
-#         extension = 'mp4'
-#         file_name = f'{title}_{video_id}.{extension}'
-#         full_file_path = os.path.join(download_path, file_name)
-
-#         if resolution == '480p':
-#             format_id = 'bestvideo[height<=480]+bestaudio/best'
-#         elif resolution == '720p':
-#             format_id = 'bestvideo[height<=720]+bestaudio/best'
-#         elif resolution == '1080p':
-#             format_id = 'bestvideo[height<=1080]+bestaudio/best'
-#         else:
-#             format_id = f'{format_id}+bestaudio/best'
-#         ydl_opts = {
-#             'format': format_id,
-#             'outtmpl': full_file_path,
-#             'noplaylist': True,
-#             'quiet': False,
-#             'merge_output_format': 'mp4',
-#             'downloader': 'aria2c',
-#             'downloader_args': {
-#                 'aria2c': ['-x', '16', '-k', '1M']
-#             },
-#             'postprocessors': [{
-#                 'key': 'FFmpegVideoConvertor',
-#                 'preferedformat': 'mp4'
-#             }]
-#         }
-
-#     logging.info(f"Downloading video to {full_file_path}")
-
-#     loop = asyncio.get_event_loop()
-#     try:
-#         await loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(ydl_opts).download([video_url]))
-#     except Exception as e:
-#         logging.error(f"Error downloading video: {e}")
-#         return {'status': 'failed'}
-
-#     if not os.path.exists(full_file_path):
-#         logging.error(f"File {full_file_path} does not exist")
-#         return {'status': 'failed'}
-
-#     file_url = f'http://{DOMAIN}/dls/{user_id}/{file_name}'
-#     await db.add_or_update_youtube_link(user_id, video_id, video_details['title'], extension, 'downloaded', full_file_path)
-#     return {
-#         'status': 'success',
-#         'file_url': file_url,
-#         'file_name': file_name,
-#         'video_id': video_id,
-#         'cover_url': cover_url,
-#         'title': video_details['title'],
-#         'file_path': full_file_path
-#     }
-
-
 async def format_filesize(user_id, filesize: int) -> str:
     user_lang = await db.get_user_lang(user_id)
     _ = get_translator(user_lang)